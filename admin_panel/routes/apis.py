@@ -1,5 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+import secrets
+import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify
 from models.server import Server, ConnectApi
+from providers import invalidate_provider
+from utils.worker import resume_polling
+from utils import metrics
+from utils import breaker
+from utils import telemetry
 
 apis_bp = Blueprint("apis", __name__, template_folder="../templates")
 
@@ -48,6 +55,23 @@ def apis():
                 retry_time = int(request.form.get("retry_time") or 0)
             except ValueError:
                 retry_time = 0
+            poll_policy = {}
+            for field, cast in (
+                ("fast_poll_interval", float),
+                ("fast_poll_window", int),
+                ("poll_backoff", float),
+                ("max_poll_interval", float),
+            ):
+                try:
+                    poll_policy[field] = cast(request.form.get(field))
+                except (TypeError, ValueError):
+                    poll_policy[field] = ConnectApi._fields[field].default
+            bulk_status_url = (request.form.get("bulk_status_url") or "").strip() or None
+            bulk_status_parser = request.form.get("bulk_status_parser") or "sms_activate"
+            push_enabled = bool(request.form.get("push_enabled"))
+            push_secret = (request.form.get("push_secret") or "").strip() or None
+            if push_enabled and not push_secret:
+                push_secret = secrets.token_urlsafe(24)
 
             server = Server.objects(id=server_id).first()
 
@@ -64,13 +88,19 @@ def apis():
                     headers=headers,
                     response_type=response_type,
                     auto_cancel_time=auto_cancel_time,
-                    retry_time=retry_time
+                    retry_time=retry_time,
+                    bulk_status_url=bulk_status_url,
+                    bulk_status_parser=bulk_status_parser,
+                    push_enabled=push_enabled,
+                    push_secret=push_secret,
+                    **poll_policy
                 ).save()
 
             elif action == "edit":
                 api_id = request.form.get("api_id")
                 api = ConnectApi.objects(id=api_id).first()
                 if api:
+                    was_pushed = api.push_enabled
                     if server:
                         api.server = server
                     api.api_name = api_name
@@ -84,14 +114,64 @@ def apis():
                     api.response_type = response_type
                     api.auto_cancel_time = auto_cancel_time
                     api.retry_time = retry_time
+                    api.bulk_status_url = bulk_status_url
+                    api.bulk_status_parser = bulk_status_parser
+                    api.push_enabled = push_enabled
+                    api.push_secret = push_secret
+                    for field, value in poll_policy.items():
+                        setattr(api, field, value)
                     api.save()
+                    invalidate_provider(api.id)
+                    if was_pushed and not push_enabled:
+                        # Its jobs left the poll schedule when push was on
+                        resume_polling(api.id)
 
         elif action == "delete":
             api_id = request.form.get("api_id")
             ConnectApi.objects(id=api_id).delete()
+            invalidate_provider(api_id)
 
         return redirect(url_for("apis.apis"))
 
     apis = ConnectApi.objects()
     servers = Server.objects()
-    return render_template("apis.html", apis=apis, servers=servers)
+    breakers = {str(api.id): _breaker_status(str(api.id)) for api in apis}
+    return render_template("apis.html", apis=apis, servers=servers, poll_stats=_poll_stats(),
+                           breakers=breakers, provider_stats=telemetry.summary(hours=24))
+
+
+@apis_bp.route("/stats")
+def stats():
+    """Provider telemetry as JSON: ?hours=24&api_id=<id>"""
+    try:
+        hours = max(1, min(int(request.args.get("hours") or 24), 24 * 90))
+    except ValueError:
+        hours = 24
+    return jsonify(hours=hours, apis=telemetry.summary(hours=hours, api_id=request.args.get("api_id")))
+
+
+def _breaker_status(api_id):
+    """Circuit breaker state with readable transition times, or None if Redis is down."""
+    try:
+        st = breaker.status(api_id)
+    except Exception:
+        return None
+    for t in st["transitions"]:
+        t["at_text"] = datetime.datetime.utcfromtimestamp(t["at"]).strftime("%Y-%m-%d %H:%M:%S")
+    return st
+
+
+def _poll_stats():
+    """{api_id: {requests, delivered, per_otp}} from the worker's counters."""
+    try:
+        counters = metrics.snapshot()
+    except Exception:
+        return {}
+    stats = {}
+    for name, value in counters.items():
+        kind, _, api_id = name.partition(":")
+        if kind in ("otp_poll_requests", "otp_delivered") and api_id:
+            stats.setdefault(api_id, {"requests": 0, "delivered": 0})[kind.split("_")[-1]] = int(value)
+    for s in stats.values():
+        s["per_otp"] = round(s["requests"] / s["delivered"], 1) if s["delivered"] else None
+    return stats
@@ -3,6 +3,8 @@ from models.user import User
 from models.order import Order
 from models.admin import Admin
 from utils.config import get_config, set_config
+from utils.registry import admins_changed
+from bot.libs.notify import EVENT_LABELS
 
 bot_settings_bp = Blueprint("bot_settings", __name__, template_folder="../templates", static_folder="../static")
 
@@ -39,10 +41,28 @@ def bot_settings():
                 set__name=new_admin_name or "",
                 upsert=True
             )
+            admins_changed()
+
+        # Notification digest for one admin
+        digest_admin_id = request.form.get("digest_admin_id")
+        if digest_admin_id:
+            try:
+                digest_interval = max(0, int(request.form.get("digest_interval") or 0))
+                digest_max_events = max(0, int(request.form.get("digest_max_events") or 0))
+            except ValueError:
+                digest_interval, digest_max_events = 0, 0
+            urgent = [e for e in request.form.getlist("urgent_events") if e in EVENT_LABELS]
+            Admin.objects(telegram_id=digest_admin_id).update_one(
+                set__digest_interval=digest_interval,
+                set__digest_max_events=digest_max_events,
+                set__urgent_events=urgent,
+            )
+            admins_changed()
 
         remove_id = request.form.get("remove_id")
         if remove_id:
             Admin.objects(telegram_id=remove_id).delete()
+            admins_changed()
 
         return redirect(url_for("bot_settings.bot_settings"))
 
@@ -61,6 +81,7 @@ def bot_settings():
                            orders_count=orders_count,
                            support_url=current_url,
                            admins=admins,
+                           digest_events=EVENT_LABELS,
                            required_group_id=current_group_id,
                            required_group_link=current_group_link,
                            required_channel_id=current_channel_id,
@@ -1,6 +1,7 @@
 # admin_panel/routes/payments.py
 from flask import Blueprint, render_template, request, redirect, url_for
 from models.payment_config import PaymentConfig
+from utils.config import invalidate_settings
 
 payments_bp = Blueprint("payments", __name__, template_folder="../templates")
 
@@ -8,6 +9,7 @@ def _cfg():
     cfg = PaymentConfig.objects().first()
     if not cfg:
         cfg = PaymentConfig().save()
+        invalidate_settings()
     return cfg
 
 @payments_bp.route("/", methods=["GET", "POST"])
@@ -38,6 +40,7 @@ def payments():
         cfg.bharatpay_upi_id = request.form.get("bharatpay_upi_id") or ""
 
         cfg.save()
+        invalidate_settings()
         return redirect(url_for("payments.payments"))
 
     return render_template("payments.html", cfg=cfg)
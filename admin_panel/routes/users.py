@@ -8,6 +8,7 @@ from models.server import Server
 from models.server import Service
 import datetime
 from models.recharge import Recharge
+from utils.registry import set_banned
 
 users_bp = Blueprint('users', __name__, template_folder='../templates')
 
@@ -155,6 +156,7 @@ def user_profile(user_id):
             # Requires `blocked` boolean on User model (see migration note)
             user.blocked = not getattr(user, 'blocked', False)
             user.save()
+            set_banned(user.telegram_id, user.blocked)
             flash('User status updated', 'success')
             return redirect(url_for('users.user_profile', user_id=user_id))
         if action == "special_discount":
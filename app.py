@@ -1,9 +1,8 @@
 import os
+import hmac
 from flask import Flask, request
-from dotenv import load_dotenv
-from telebot import TeleBot
-from mongoengine import connect
 import json
+from bson import ObjectId
 
 from bot.dispatcher import dispatcher
 from admin_panel.routes.dashboard import dashboard_bp
@@ -19,33 +18,36 @@ from admin_panel.routes.promos import promos_bp
 from models.recharge import Recharge
 from models.transaction import Transaction
 from models.user import User
-from models.payment_config import PaymentConfig
+from models.server import ConnectApi
 
 
 
-from utils.worker import init_worker
+from utils.worker import live_workers, receive_pushed_otp
+from utils import metrics
+from utils.config import get_payment_config
+from bot.runtime import create_bot
+from bot.update_queue import enqueue_update, queue_depth
+from bot.dedup import is_duplicate
+from utils.registry import load_registries
+from bot.sender import start_sender, outbox_depth
+from utils.broadcaster import start_broadcaster
 
 
 
-# Load env vars
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/virtualsim")
+# Load env vars, init DB and Telebot
+bot = create_bot()
+load_registries()
 
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN environment variable is required")
-
-# Init DB
-connect(host=MONGO_URI)
+# "inline" dispatches inside the request, "queue" only enqueues for bot.consumer
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "inline")
 
 # Init Flask
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY") or os.urandom(24)
 
-# Init Telebot (just for parsing)
-bot = TeleBot(BOT_TOKEN, parse_mode="HTML")
-
-init_worker(bot)
+# OTP polling runs in its own process: python -m utils.worker
+start_sender(bot)
+start_broadcaster(bot)
 
 # Register admin routes
 app.register_blueprint(dashboard_bp, url_prefix="/admin")
@@ -80,10 +82,18 @@ def webhook():
                 except Exception:
                     update = None
 
+        if update and is_duplicate(update.get("update_id")):
+            # Telegram redelivery of an update we already accepted
+            return "OK", 200
+
         if update:
             try:
-                # call your dispatcher (wrap handler execution so it can't raise)
-                dispatcher.handle_update(update, bot)
+                if WEBHOOK_MODE == "queue":
+                    # consumers (python -m bot.consumer) run the handlers
+                    enqueue_update(update)
+                else:
+                    # call your dispatcher (wrap handler execution so it can't raise)
+                    dispatcher.handle_update(update, bot)
             except Exception as e:
                 # log but do NOT return an error to Telegram
                 app.logger.exception("Error while handling update: %s", e)
@@ -102,7 +112,7 @@ from flask import jsonify
 
 @app.route("/webhooks/crypto", methods=["POST"])
 def crypto_webhook():
-    cfg = PaymentConfig.objects().first()
+    cfg = get_payment_config()
     if not cfg: return "no cfg", 400
     # Validate secret header/body (implementation depends on provider)
     if cfg.crypto_webhook_secret and request.headers.get("X-Webhook-Secret") != cfg.crypto_webhook_secret:
@@ -132,7 +142,7 @@ def crypto_webhook():
 
 @app.route("/webhooks/bharatpay", methods=["POST"])
 def bharatpay_webhook():
-    cfg = PaymentConfig.objects().first()
+    cfg = get_payment_config()
     if not cfg: return "no cfg", 400
     if cfg.bharatpay_webhook_secret and request.headers.get("X-Webhook-Secret") != cfg.bharatpay_webhook_secret:
         return "forbidden", 403
@@ -158,10 +168,36 @@ def bharatpay_webhook():
     return jsonify(ok=True)
 
 
+@app.route("/webhooks/otp/<api_id>", methods=["POST"])
+def otp_webhook(api_id):
+    """Incoming SMS pushed by a provider (ConnectApi.push_enabled)."""
+    api = ConnectApi.objects(id=api_id).first() if ObjectId.is_valid(api_id) else None
+    if not api or not api.push_enabled: return "not found", 404
+    # Secret in a header, or ?secret= for providers that can only configure a URL
+    secret = request.headers.get("X-Webhook-Secret") or request.args.get("secret") or ""
+    if not api.push_secret or not hmac.compare_digest(secret.encode(), api.push_secret.encode()):
+        return "forbidden", 403
+    data = request.get_json(force=True, silent=True) or request.form.to_dict()
+    try:
+        delivered = receive_pushed_otp(api, data)
+    except Exception as e:
+        app.logger.exception("Error while handling pushed OTP: %s", e)
+        return "error", 500   # let the provider retry
+    return jsonify(ok=True, delivered=delivered)
+
+
 @app.route("/webhook/<token>", methods=["POST"])
 def webhooka(token):
     return "OK", 200
 
+@app.route("/metrics")
+def metrics_view():
+    data = metrics.snapshot()
+    data["update_queue_depth"] = queue_depth()
+    data["outbox_depth"] = outbox_depth()
+    data["otp_workers"] = len(live_workers())
+    return jsonify(data)
+
 @app.route("/")
 def index():
     return "Hello World!"
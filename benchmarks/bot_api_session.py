@@ -0,0 +1,89 @@
+"""
+Micro-benchmark: Bot API calls through the pooled session (bot.http_session)
+versus a new connection per call, against a local fake Bot API server.
+
+The "unpooled" client opens a fresh connection for every call, which is what
+pyTelegramBotAPI's per-thread sessions amount to when each webhook request
+runs on a new thread. --handshake-ms models the TCP + TLS setup to
+api.telegram.org that pooling saves.
+
+Usage:
+    python -m benchmarks.bot_api_session --calls 500 --threads 16
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from telebot import TeleBot, apihelper
+
+from benchmarks.fake_http import percentile, serve
+from bot import http_session
+
+MESSAGE = {
+    "ok": True,
+    "result": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "ok"},
+}
+
+
+def _unpooled_send(method, url, params=None, files=None, timeout=None, proxies=None):
+    # requests.request builds (and closes) a new session, so a new connection
+    return requests.request(method, url, params=params, files=files,
+                            timeout=(http_session.CONNECT_TIMEOUT, http_session.READ_TIMEOUT),
+                            proxies=proxies)
+
+
+def _run(bot, calls: int, threads: int) -> dict:
+    def one(_):
+        start = time.perf_counter()
+        bot.send_message(1, "benchmark")
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = list(pool.map(one, range(calls)))
+    elapsed = time.perf_counter() - started
+    return {
+        "mean_ms": 1000 * sum(samples) / len(samples),
+        "p50_ms": 1000 * percentile(samples, 0.50),
+        "p95_ms": 1000 * percentile(samples, 0.95),
+        "calls_per_s": calls / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs unpooled Bot API calls")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=20,
+                        help="server time per request")
+    parser.add_argument("--handshake-ms", type=float, default=60,
+                        help="extra time per new connection (TCP + TLS)")
+    args = parser.parse_args()
+
+    server = serve(lambda path: (200, MESSAGE),
+                   latency=args.latency_ms / 1000, handshake=args.handshake_ms / 1000)
+    apihelper.API_URL = f"http://127.0.0.1:{server.server_port}/bot{{0}}/{{1}}"
+    bot = TeleBot("123:benchmark")
+
+    results = {}
+    apihelper.session = None
+    apihelper.CUSTOM_REQUEST_SENDER = _unpooled_send
+    before = server.connections
+    results["unpooled"] = dict(_run(bot, args.calls, args.threads), connections=server.connections - before)
+
+    http_session.install_session()
+    before = server.connections
+    results["pooled"] = dict(_run(bot, args.calls, args.threads), connections=server.connections - before)
+
+    print(f"{args.calls} sendMessage calls, {args.threads} threads, "
+          f"{args.latency_ms:g} ms/request, {args.handshake_ms:g} ms/connection")
+    print(f"{'client':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'calls/s':>10}{'conns':>8}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['mean_ms']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['calls_per_s']:>10.1f}{r['connections']:>8}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# ===========================
+# Local fake HTTP upstream for benchmarks
+# ===========================
+# Keep-alive (HTTP/1.1) server that answers every request with
+# `respond(path) -> (status, body)`. `handshake` seconds are slept once per
+# new connection to stand in for TCP + TLS setup to a remote host, and
+# `latency` seconds on every request for the upstream's own work.
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # One write per response, sent at once: no Nagle / delayed-ACK stalls
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status, body = self.server.respond(self.path)
+        payload = body if isinstance(body, (bytes, str)) else json.dumps(body)
+        payload = payload.encode() if isinstance(payload, str) else payload
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(respond, latency: float = 0.0, handshake: float = 0.0) -> ThreadingHTTPServer:
+    """Start the server on a free localhost port; `server.server_port` has the port."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.respond = respond
+    server.latency = latency
+    server.handshake = handshake
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
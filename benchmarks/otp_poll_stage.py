@@ -0,0 +1,119 @@
+"""
+Benchmark: one OTP worker poll stage over N pending orders, polled one after
+another (the old loop), on one shared 32-thread pool capped per host by
+providers.base (the previous worker), and on the worker's per-host pools,
+against local fake SMS-activate providers.
+
+Each fake provider is its own host (port), answers STATUS_WAIT_CODE for most
+orders and STATUS_OK:<code> for every --ok-every'th, and stalls --slow-ms for
+every --slow-every'th order. The first --slow-hosts providers stall on every
+request, standing in for a provider that is down to a crawl; "fast done s" is
+when the last order of the other hosts was answered.
+
+Usage:
+    python -m benchmarks.otp_poll_stage --orders 200 --providers 4
+    python -m benchmarks.otp_poll_stage --orders 80 --providers 2 --slow-hosts 1 \
+        --slow-ms 1000 --latency-ms 10
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fake_http import percentile, serve
+from providers import GenericProvider
+from providers import base as provider_base
+from utils import worker
+
+
+SHARED_THREADS = 32   # the previous worker's single poll pool
+
+
+def _responder(args, slow_host: bool):
+    def respond(path):
+        order_id = int(parse_qs(urlparse(path).query)["id"][0])
+        if slow_host or (args.slow_every and order_id % args.slow_every == 0):
+            time.sleep(args.slow_ms / 1000)
+        if args.ok_every and order_id % args.ok_every == 0:
+            return 200, f"STATUS_OK:{100000 + order_id}"
+        return 200, "STATUS_WAIT_CODE"
+    return respond
+
+
+def _poll(job):
+    # api_id=None: no breaker / telemetry writes, so no Redis is needed
+    provider, order_id, _ = job
+    start = time.perf_counter()
+    otp_token, _ = provider.get_status(order_id)
+    end = time.perf_counter()
+    return end - start, end, otp_token
+
+
+def _stage(jobs, mode: str, slow_urls: set) -> dict:
+    started = time.perf_counter()
+    if mode == "per-host":
+        futures = [worker._host_pool(urlparse(url).netloc).submit(_poll, (provider, order_id, url))
+                   for provider, order_id, url in jobs]
+        results = [f.result() for f in futures]
+    elif mode == "shared":
+        with ThreadPoolExecutor(max_workers=SHARED_THREADS) as pool:
+            results = list(pool.map(_poll, jobs))
+    else:
+        results = [_poll(job) for job in jobs]
+    wall = time.perf_counter() - started
+    latencies = [latency for latency, _, _ in results]
+    fast_done = [end - started for (_, _, url), (_, end, _) in zip(jobs, results)
+                 if url not in slow_urls]
+    return {
+        "wall_s": wall,
+        "sum_s": sum(latencies),
+        "slowest_s": max(latencies),
+        "p95_s": percentile(latencies, 0.95),
+        "fast_done_s": max(fast_done, default=0.0),
+        "codes": sum(1 for _, _, token in results if token),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OTP worker poll stage")
+    parser.add_argument("--orders", type=int, default=200, help="pending orders per stage")
+    parser.add_argument("--providers", type=int, default=4, help="fake provider hosts")
+    parser.add_argument("--latency-ms", type=float, default=50, help="provider time per request")
+    parser.add_argument("--slow-ms", type=float, default=1000)
+    parser.add_argument("--slow-every", type=int, default=50)
+    parser.add_argument("--ok-every", type=int, default=10)
+    parser.add_argument("--slow-hosts", type=int, default=0,
+                        help="providers that take --slow-ms on every request")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    servers = [serve(_responder(args, i < args.slow_hosts), latency=args.latency_ms / 1000)
+               for i in range(args.providers)]
+    urls = [f"http://127.0.0.1:{s.server_port}/stubs/handler_api.php?action=getStatus&id={{id}}"
+            for s in servers]
+    providers = [GenericProvider(status_url=url) for url in urls]
+    jobs = [(providers[i % len(providers)], str(i + 1), urls[i % len(providers)])
+            for i in range(args.orders)]
+    slow_urls = set(urls[:args.slow_hosts])
+
+    # Warm the keep-alive pool so every run measures polling, not connects
+    _stage(jobs[:len(providers)], "sequential", slow_urls)
+
+    modes = ("shared", "per-host") if args.skip_sequential else ("sequential", "shared", "per-host")
+    results = {mode: _stage(jobs, mode, slow_urls) for mode in modes}
+    worker._shutdown_poll_pools()
+
+    print(f"{args.orders} orders over {args.providers} providers ({args.slow_hosts} slow), "
+          f"{args.latency_ms:g} ms/request, every {args.slow_every}th order {args.slow_ms:g} ms; "
+          f"{SHARED_THREADS} shared threads, {provider_base.HOST_CONCURRENCY} per host")
+    print(f"{'stage':<12}{'wall s':>9}{'sum s':>9}{'slowest s':>11}{'p95 s':>8}"
+          f"{'fast done s':>13}{'codes':>7}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['wall_s']:>9.2f}{r['sum_s']:>9.2f}{r['slowest_s']:>11.2f}"
+              f"{r['p95_s']:>8.2f}{r['fast_done_s']:>13.2f}{r['codes']:>7}")
+    for s in servers:
+        s.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Consumer pool for updates queued by the webhook (WEBHOOK_MODE=queue).
+
+A single reader pops updates in arrival order and shards them by chat_id
+over the worker pool, so each chat's updates run strictly in order while
+different chats run in parallel. Run one consumer per queue; scale with
+--workers (use --mode process to use all cores).
+
+SIGTERM stops reading and drains the shards before exiting. Updates are
+acknowledged only after they were handled, so anything a killed consumer
+held is handled again by the next one.
+
+Usage:
+    python -m bot.consumer --workers 8 --mode process
+"""
+import argparse
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import signal
+import threading
+
+from bot.update_queue import ack_update, pop_update, requeue_unacked
+from bot.executor import ShardedExecutor, shard_key
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+bot = None
+
+
+def _init():
+    # Each process opens its own MongoDB / HTTP connections
+    global bot
+    if multiprocessing.parent_process() is not None:
+        # Shard process: the parent decides when to stop and drains us
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        multiprocessing.util.Finalize(None, metrics.flush, exitpriority=10)
+
+    from bot.runtime import create_bot
+    from utils.registry import load_registries
+    from bot.sender import start_sender
+
+    bot = create_bot()
+    start_sender(bot)
+    load_registries()
+
+
+def _handle(item):
+    from bot.dispatcher import dispatcher
+
+    raw, update = item
+    try:
+        with metrics.timer("update_handle_seconds"):
+            dispatcher.handle_update(update, bot)
+        metrics.incr("updates_processed")
+    except Exception as e:
+        metrics.incr("updates_failed")
+        logger.exception("Error while handling queued update: %s", e)
+    finally:
+        ack_update(raw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consume queued Telegram updates")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("CONSUMER_WORKERS", "4")))
+    parser.add_argument("--mode", choices=["thread", "process"],
+                        default=os.getenv("CONSUMER_MODE", "thread"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    executor = ShardedExecutor(_handle, shards=args.workers, mode=args.mode,
+                               initializer=_init)
+    # Updates a previous run popped but never finished are handled again
+    requeued = requeue_unacked()
+    if requeued:
+        logger.info("Requeued %d unacknowledged updates", requeued)
+
+    # SIGTERM / Ctrl+C: stop popping, let the shards finish what they hold
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    try:
+        while not stop.is_set():
+            item = pop_update(timeout=1)
+            if item is None:
+                continue
+            executor.submit(shard_key(item[1]), item)
+    finally:
+        logger.info("Draining consumer shards")
+        executor.shutdown()
+        metrics.flush()
+
+
+if __name__ == "__main__":
+    main()
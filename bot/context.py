@@ -0,0 +1,48 @@
+from models.user import User
+
+
+class UpdateContext:
+    """
+    Per-update state built once by the dispatcher.
+
+    Handlers opt in by declaring a `ctx` parameter:
+        def handle(bot, call, ctx=None): ...
+
+    - `ctx.user` is the `User` for the sender, loaded at most once.
+    - `ctx.args` are the parsed callback/command arguments
+      ("purchase:abc" -> ["abc"], "/ban 123" -> ["123"]).
+    - `ctx.get(Model, **query)` is an identity map: the same query (or the
+      same primary key) within one update returns the already loaded object.
+    """
+
+    def __init__(self, user_id: str, chat_id=None, args=None):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.args = args or []
+        self._identity = {}
+
+    def get(self, model, **query):
+        key = (model, tuple(sorted(query.items())))
+        if key in self._identity:
+            return self._identity[key]
+        obj = model.objects(**query).first()
+        self._identity[key] = obj
+        if obj is not None:
+            self._identity[(model, (("id", obj.pk),))] = obj
+        return obj
+
+    def remember(self, obj, **query):
+        """Register an object we loaded/created ourselves (e.g. after modify())."""
+        model = type(obj)
+        self._identity[(model, (("id", obj.pk),))] = obj
+        if query:
+            self._identity[(model, tuple(sorted(query.items())))] = obj
+        return obj
+
+    @property
+    def user(self):
+        return self.get(User, telegram_id=self.user_id)
+
+    @user.setter
+    def user(self, obj):
+        self.remember(obj, telegram_id=self.user_id)
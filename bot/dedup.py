@@ -0,0 +1,38 @@
+import threading
+from cachetools import LRUCache
+
+from utils.redis_client import redis_client
+from utils import metrics
+
+# ===========================
+# update_id de-duplication
+# ===========================
+DEDUP_TTL = 3600          # Telegram stops redelivering well within an hour
+_seen = LRUCache(maxsize=10000)
+_seen_lock = threading.Lock()
+
+
+def is_duplicate(update_id) -> bool:
+    """
+    True if this update_id was already accepted by any node.
+    Checks the in-process LRU first, then claims the id in Redis with SET NX.
+    """
+    if update_id is None:
+        return False
+
+    with _seen_lock:
+        if update_id in _seen:
+            metrics.incr("updates_duplicate")
+            return True
+        _seen[update_id] = True
+
+    try:
+        claimed = redis_client.set(f"update_seen:{update_id}", 1, ex=DEDUP_TTL, nx=True)
+    except Exception:
+        # Redis down: the local LRU is still better than nothing
+        return False
+
+    if not claimed:
+        metrics.incr("updates_duplicate")
+        return True
+    return False
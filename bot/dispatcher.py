@@ -1,6 +1,17 @@
+import inspect
 from bot.groups import command_handlers, callback_handlers,inline_handlers,message_handlers
-from models.user import User
-from utils.check_user import ensure_membership
+from bot.context import UpdateContext
+from utils.check_user import ensure_membership, warm_membership
+from utils.registry import is_banned
+
+
+def _wants_ctx(func):
+    """Handlers opt in to the per-update context by declaring a `ctx` parameter."""
+    try:
+        return "ctx" in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+
 
 class Dispatcher:
     def __init__(self):
@@ -8,18 +19,32 @@ class Dispatcher:
         self.callback_handlers = {}
         self.inline_handlers = []
         self.message_handlers = []
+        self.ctx_handlers = set()
+
+    def _track(self, func):
+        if _wants_ctx(func):
+            self.ctx_handlers.add(func)
+
+    def _call(self, func, bot, payload, ctx):
+        if func in self.ctx_handlers:
+            return func(bot, payload, ctx=ctx)
+        return func(bot, payload)
     
     def register_message(self, func):
         self.message_handlers.append(func)
+        self._track(func)
 
     def register_command(self, cmd, func):
         self.command_handlers[cmd] = func
+        self._track(func)
 
     def register_callback(self, data_key, func):
         self.callback_handlers[data_key] = func
+        self._track(func)
     
     def register_inline(self, func):
         self.inline_handlers.append(func)
+        self._track(func)
 
     def handle_update(self, update, bot):
         """Manually route updates to correct handler"""
@@ -28,6 +53,7 @@ class Dispatcher:
             text = update["message"]["text"]
             user_id = str(update["message"]["from"]["id"])
             chat_id = update["message"]["chat"]["id"]
+            ctx = UpdateContext(user_id, chat_id, text.split()[1:])
 
             if _reject_if_blocked_or_not_member(bot, chat_id, user_id):
                 return
@@ -35,32 +61,37 @@ class Dispatcher:
             if text.startswith("/"):
                 cmd = text.split()[0][1:]
                 if cmd in self.command_handlers:
-                    self.command_handlers[cmd](bot, update["message"])
+                    self._call(self.command_handlers[cmd], bot, update["message"], ctx)
             else:
                 for fn in self.message_handlers:
-                    fn(bot, update["message"])
+                    self._call(fn, bot, update["message"], ctx)
 
         elif "callback_query" in update:
             user_id = str(update["callback_query"]["from"]["id"])
             chat_id = update["callback_query"]["message"]["chat"]["id"]
+            data = update["callback_query"]["data"]
+            ctx = UpdateContext(user_id, chat_id, data.split(":")[1:])
 
             if _reject_if_blocked_or_not_member(bot, chat_id, user_id):
                 return
 
-            data = update["callback_query"]["data"]
             prefix = data.split(":")[0]
             if prefix in self.callback_handlers:
-                self.callback_handlers[prefix](bot, update["callback_query"])
+                self._call(self.callback_handlers[prefix], bot, update["callback_query"], ctx)
+
+        elif "chat_member" in update:
+            # join/leave events in required chats keep the membership cache warm
+            warm_membership(update["chat_member"])
 
         elif "inline_query" in update:
+            ctx = UpdateContext(str(update["inline_query"]["from"]["id"]))
             for func in self.inline_handlers:
-                func(bot, update["inline_query"])
+                self._call(func, bot, update["inline_query"], ctx)
 
 def _reject_if_blocked_or_not_member(bot, chat_id, user_id):
     if not ensure_membership(bot, chat_id, user_id):
         return True
-    user = User.objects(telegram_id=user_id).first()
-    if user and getattr(user, "blocked", False):
+    if is_banned(user_id):
         bot.send_message(chat_id, "❌ You are banned by admin, you can't use this bot")
         return True
     return False
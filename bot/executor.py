@@ -0,0 +1,86 @@
+import logging
+import multiprocessing
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+_STOP = None
+
+
+def shard_key(update: dict):
+    """
+    Pick the ordering key for an update: the chat it belongs to,
+    falling back to the sender for updates without a chat (inline queries).
+    """
+    for kind in ("message", "edited_message", "chat_member", "my_chat_member"):
+        if kind in update:
+            return update[kind].get("chat", {}).get("id")
+    if "callback_query" in update:
+        cq = update["callback_query"]
+        msg = cq.get("message") or {}
+        return msg.get("chat", {}).get("id") or cq["from"]["id"]
+    if "inline_query" in update:
+        return update["inline_query"]["from"]["id"]
+    return update.get("update_id", 0)
+
+
+def _run_shard(q, target, initializer):
+    if initializer:
+        initializer()
+    while True:
+        item = q.get()
+        if item is _STOP:
+            break
+        try:
+            target(item)
+        except Exception as e:
+            logger.exception("Error in sharded executor: %s", e)
+
+
+class ShardedExecutor:
+    """
+    Runs `target(item)` on a pool of threads or processes.
+    Items with the same key always go to the same shard, so they run
+    strictly in submission order; different keys run in parallel.
+
+    In "process" mode `initializer` runs once inside each child, and
+    `target` / `initializer` must be module-level functions.
+    In "thread" mode `initializer` runs once in the calling process.
+    """
+
+    def __init__(self, target, shards: int = 4, mode: str = "thread",
+                 initializer=None, max_pending: int = 1000):
+        if mode not in ("thread", "process"):
+            raise ValueError("mode must be 'thread' or 'process'")
+        self.shards = max(1, shards)
+        self.mode = mode
+        self.queues = []
+        self.workers = []
+
+        if mode == "thread" and initializer:
+            initializer()
+
+        for _ in range(self.shards):
+            if mode == "process":
+                q = multiprocessing.Queue(maxsize=max_pending)
+                w = multiprocessing.Process(
+                    target=_run_shard, args=(q, target, initializer), daemon=True)
+            else:
+                q = queue.Queue(maxsize=max_pending)
+                w = threading.Thread(
+                    target=_run_shard, args=(q, target, None), daemon=True)
+            w.start()
+            self.queues.append(q)
+            self.workers.append(w)
+
+    def submit(self, key, item):
+        """Queue `item` on the shard owning `key`. Blocks if that shard is full."""
+        self.queues[hash(key) % self.shards].put(item)
+
+    def shutdown(self, wait: bool = True):
+        for q in self.queues:
+            q.put(_STOP)
+        if wait:
+            for w in self.workers:
+                w.join()
@@ -1,6 +1,7 @@
 # bot/handlers/ban.py
 from models.user import User
 from bot.libs.helpers import is_admin
+from utils.registry import set_banned
 
 def handle(bot, message: dict):
     """
@@ -35,6 +36,7 @@ def handle(bot, message: dict):
             return
         user.blocked = True
         user.save()
+        set_banned(target_id, True)
         bot.send_message(chat_id, f"✅ User {target_id} has been banned.")
     elif command == "/unban":
         if not getattr(user, "blocked", False):
@@ -42,4 +44,5 @@ def handle(bot, message: dict):
             return
         user.blocked = False
         user.save()
+        set_banned(target_id, False)
         bot.send_message(chat_id, f"✅ User {target_id} has been unbanned.")
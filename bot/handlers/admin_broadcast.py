@@ -1,13 +1,15 @@
 # bot/handlers/broadcast.py
-from models.user import User
 from bot.libs.helpers import is_admin
-import time
+from utils.broadcaster import create_broadcast, set_status, update_status_message
 
 def handle(bot, message: dict):
     """
     Handles /broadcast command.
     Usage:
         /broadcast <your message here>
+        /broadcast --all <message>   (also retry users marked unreachable)
+    The job runs in the background; progress is shown in one message
+    with Pause / Resume / Cancel buttons.
     """
     admin_id = str(message["from"]["id"])
     chat_id = message["chat"]["id"]
@@ -21,26 +23,35 @@ def handle(bot, message: dict):
         bot.send_message(chat_id, "⚠️ Usage: /broadcast <message>")
         return
 
-    broadcast_msg = parts[1]
-
-    users = User.objects(blocked=False)
-    sent_count, failed_count = 0, 0
-
-    bot.send_message(chat_id, f"📢 Starting broadcast to {users.count()} users...")
-
-    for user in users:
-        try:
-            bot.send_message(user.telegram_id, broadcast_msg)
-            sent_count += 1
-            time.sleep(0.05)  # prevent hitting Telegram flood limits
-        except Exception as e:
-            failed_count += 1
-            # you may log this error if needed
-            continue
-
-    bot.send_message(
-        chat_id,
-        f"✅ Broadcast finished!\n\n"
-        f"📨 Sent: {sent_count}\n"
-        f"⚠️ Failed: {failed_count}"
-    )
+    text = parts[1]
+    include_unreachable = text.startswith("--all ")
+    if include_unreachable:
+        text = text[len("--all "):].strip()
+
+    create_broadcast(bot, chat_id, admin_id, text, include_unreachable)
+
+
+def handle_callback(bot, call):
+    """bcast:<pause|resume|cancel>:<job_id>"""
+    if not is_admin(str(call["from"]["id"])):
+        bot.answer_callback_query(call["id"], "Not allowed.")
+        return
+
+    try:
+        _, action, job_id = call["data"].split(":")
+    except ValueError:
+        bot.answer_callback_query(call["id"], "Invalid action.")
+        return
+
+    status = {"pause": "paused", "resume": "pending", "cancel": "cancelled"}.get(action)
+    if not status:
+        bot.answer_callback_query(call["id"], "Invalid action.")
+        return
+
+    job = set_status(job_id, status)
+    if not job:
+        bot.answer_callback_query(call["id"], "Broadcast not found.")
+        return
+
+    update_status_message(bot, job)
+    bot.answer_callback_query(call["id"], f"Broadcast {job.status}.")
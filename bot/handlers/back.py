@@ -5,11 +5,11 @@ from bot.libs.helpers import safe_edit_message
 from models.order import Order
 from models.otp import OtpMessage
 
-def handle(bot, call):
+def handle(bot, call, ctx=None):
     """Handles the Back button → return to main menu"""
 
     user_id = str(call["from"]["id"])
-    user = User.objects(telegram_id=user_id).first()
+    user = ctx.user if ctx else User.objects(telegram_id=user_id).first()
 
     if not user:
         bot.send_message(call["message"]["chat"]["id"], "❌ User not found. Please use /start first.")
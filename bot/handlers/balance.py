@@ -2,10 +2,10 @@ from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from models.user import User
 from bot.libs.helpers import safe_edit_message
 
-def handle(bot, call):
+def handle(bot, call, ctx=None):
     """Handles Balance callback"""
     user_id = str(call["from"]["id"])
-    user = User.objects(telegram_id=user_id).first()
+    user = ctx.user if ctx else User.objects(telegram_id=user_id).first()
 
     if not user:
         bot.send_message(call["message"]["chat"]["id"], "❌ User not found. Please use /start first.")
@@ -3,10 +3,11 @@ from models.otpPending import OtpPending
 from models.order import Order
 from models.transaction import Transaction
 from models.user import User
-import requests
-from models.admin import Admin
 from bot.libs.Admin_message import cancel_text
+from bot.libs.notify import notify_admins
 from models.otp import OtpMessage
+from utils.worker import FINISHED_STATUSES, unschedule_otp
+from providers import GenericProvider, get_provider
 import datetime
 from telebot import types
 
@@ -35,15 +36,10 @@ def handle(bot, call):
 
     # Attempt provider cancel (best-effort)
     try:
-        if pending_otp.cancel_url:
-            url = pending_otp.cancel_url.format(id=provider_order_id)
-            res = requests.get(url, timeout=5)
-            print("Cancel URL Response:", res.text)
-
-            if pending_otp.responseType == "Text":
-                if not (res.text.strip().startswith("ACCESS_CANCEL") or res.text.strip().startswith("NO_ACTIVATION")):
-                    bot.send_message(call["message"]["chat"]["id"], "⚠️ We are not able to cancel this request.")
-                    return
+        provider = get_provider(pending_otp.api_id) or GenericProvider.from_pending(pending_otp)
+        if not provider.cancel(provider_order_id):
+            bot.send_message(call["message"]["chat"]["id"], "⚠️ We are not able to cancel this request.")
+            return
     except Exception as e:
 
         print("Cancel URL Error:", e)
@@ -52,26 +48,28 @@ def handle(bot, call):
                          "⚠️ We are not able to cancel this request.")
         return
 
-    # Find corresponding Order by provider_order_id and refund if needed
+    # Conditional transition: the auto-cancel may have finished the order meanwhile
+    if not Order.objects(id=order.id, status__nin=FINISHED_STATUSES).update_one(set__status="cancelled"):
+        bot.send_message(call["message"]["chat"]["id"],
+                         "❌ Order is already cancelled.")
+        return
     order.status = "cancelled"
-    order.save()
-        
+
     isRefund = not OtpMessage.objects(order=order).count() > 0
     user = order.user
-    if order and order.status not in ("cancelled", "refunded", "completed"):
-        if isRefund:
-            user.balance += order.price
-            user.save()
-
-            Transaction(
-                user=user,
-                type="credit",
-                amount=order.price,
-                closing_balance=user.balance,
-                note=f"refund issued for not using mobile number {order.number}",
-            ).save()
-
-    user.reload()
+    if isRefund:
+        # Atomic credit: the balance may have changed since the order was loaded
+        user = User.objects(id=user.id).modify(inc__balance=order.price, new=True)
+
+        Transaction(
+            user=user,
+            type="credit",
+            amount=order.price,
+            closing_balance=user.balance,
+            note=f"refund issued for not using mobile number {order.number}",
+        ).save()
+    else:
+        user.reload()
 
     # remove pending otp
 
@@ -86,9 +84,7 @@ def handle(bot, call):
 
     bot.send_message(call["message"]["chat"]["id"], text)
     bot.answer_callback_query(call["id"], "✅ Cancelled.")
-    # notify admins
-    admins = Admin.objects()
-
+    # notify admins (queued, delivered in the background)
     cancel_text2 = cancel_text.format(
         user_id=call["from"]["id"],
         name=call["from"].get("first_name", "Unknown"),
@@ -108,10 +104,10 @@ def handle(bot, call):
                 if otp.otp:  # make sure otp field is not None
                     cancel_text2 += f"\n{otp.otp}"
 
-    for admin in admins:
-        try:
-            bot.send_message(admin.telegram_id, cancel_text2)
-        except Exception as e:
-            print(f"Failed to send to {admin.telegram_id}: {e}")
-            pass
+    notify_admins(
+        cancel_text2,
+        event="cancel",
+        detail=f"+{pending_otp.phone} — {pending_otp.price} 💎 — {'refunded' if isRefund else 'no refund'} — user {call['from']['id']}",
+    )
+    unschedule_otp(pending_otp.id)
     pending_otp.delete()
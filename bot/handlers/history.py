@@ -71,7 +71,7 @@ def build_history_message(user, page=1):
     return "\n".join(lines), kb
 
 
-def handle(bot, call):
+def handle(bot, call, ctx=None):
     """
     Called for callback_query where callback_data starts with "history".
     data can be "history" (open page 1) or "history:<page>"
@@ -87,7 +87,7 @@ def handle(bot, call):
         except Exception:
             page = 1
 
-    user = User.objects(telegram_id=str(call["from"]["id"])).first()
+    user = ctx.user if ctx else User.objects(telegram_id=str(call["from"]["id"])).first()
     if not user:
         bot.answer_callback_query(call["id"], "❌ User not found.")
         return
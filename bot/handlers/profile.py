@@ -55,13 +55,13 @@ def build_profile_message(user):
     return text, kb
 
 
-def handle(bot, call):
+def handle(bot, call, ctx=None):
     """
     Callback handler for callback_data starting with "profile".
     Supports "profile" or "profile:<page_or_id>" (we ignore the second part here).
     """
     user_id = str(call["from"]["id"])
-    user = User.objects(telegram_id=user_id).first()
+    user = ctx.user if ctx else User.objects(telegram_id=user_id).first()
     if not user:
         bot.answer_callback_query(call["id"], "❌ User not found.")
         return
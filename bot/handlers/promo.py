@@ -4,15 +4,17 @@ from models.user import User
 from services.promos import redeem_code
 from bot.libs.helpers import safe_edit_message
 
-def _ensure_user(bot, from_):
+def _ensure_user(bot, from_, ctx=None):
     uid = str(from_["id"])
-    user = User.objects(telegram_id=uid).first()
+    user = ctx.user if ctx else User.objects(telegram_id=uid).first()
     if not user:
         user = User(telegram_id=uid, username=from_.get("username", "")).save()
+        if ctx:
+            ctx.user = user
     return user
 
-def menu(bot, call):
-    _ensure_user(bot, call["from"])
+def menu(bot, call, ctx=None):
+    _ensure_user(bot, call["from"], ctx)
     text = "🎟️ <b>Use Promo</b>\n\nSend me your promo code (case-insensitive)."
     kb = InlineKeyboardMarkup()
     kb.row(InlineKeyboardButton("« Back", callback_data="back_main"))
@@ -21,13 +23,13 @@ def menu(bot, call):
                      "Please reply with your code:",
                      reply_markup=ForceReply(selective=True))
 
-def capture_code(bot, message):
+def capture_code(bot, message, ctx=None):
     reply = message.get("reply_to_message")
     if not reply: return
     if "Please reply with your code" not in (reply.get("text") or ""):
         return
     code = (message.get("text") or "").strip()
-    user = _ensure_user(bot, message["from"])
+    user = _ensure_user(bot, message["from"], ctx)
 
     ok, msg = redeem_code(bot, user, code)
     bot.send_message(message["chat"]["id"], msg)
@@ -1,4 +1,3 @@
-import requests
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from models.user import User
 from models.order import Order
@@ -6,8 +5,10 @@ from models.server import Service, ConnectApi
 from models.transaction import Transaction
 from utils.worker import notify_new_otp
 from models.otpPending import OtpPending
-from models.admin import Admin
 from bot.libs.Admin_message import purchase_text
+from bot.libs.notify import notify_admins
+from utils import breaker
+from providers import get_provider
 from services.promos import apply_discount_for_service, consume_reserved_promo
 
 def unavailable_markup(service_id):
@@ -35,23 +36,23 @@ def update_progress(bot, chat_id, message_id, step):
             pass
 
 
-def handle(bot, call):
+def handle(bot, call, ctx=None):
     user_id = str(call["from"]["id"])
     chat_id = call["message"]["chat"]["id"]
     progress_msg_id = None
-    user = User.objects(telegram_id=user_id).first()
+    user = ctx.user if ctx else User.objects(telegram_id=user_id).first()
     if not user:
         bot.answer_callback_query(call["id"], "❌ Please /start first.")
         return
 
     # Parse service id
-    data = call["data"].split(":")
-    if len(data) != 2:
+    args = ctx.args if ctx else call["data"].split(":")[1:]
+    if len(args) != 1:
         bot.answer_callback_query(call["id"], "⚠️ Invalid request.")
         return
 
-    service_id = data[1]
-    service = Service.objects(service_id=service_id).first()
+    service_id = args[0]
+    service = ctx.get(Service, service_id=service_id) if ctx else Service.objects(service_id=service_id).first()
     if not service:
         bot.answer_callback_query(call["id"], "❌ Service not found.")
         return
@@ -96,26 +97,32 @@ def handle(bot, call):
                 pass
         return
     try:
-        url = connect.get_number_url.format(service_code=service.code)
-    except Exception:
-        bot.send_message(chat_id, "🚫 Number not available on this service.", reply_markup=unavailable_markup(service_id))
-        bot.answer_callback_query(call["id"], "🚫 Number not available on this  service.")
+        provider = get_provider(connect)
+    except ValueError:
+        provider = None   # bad URL template: logged and the API's breaker opened
+    update_progress(bot, chat_id, progress_msg_id, 3)
+
+    # Provider failing: answer now instead of waiting for the request to time out
+    if provider is None or not breaker.allow(provider.api_id):
+        bot.send_message(chat_id, "🚫 This server is temporarily unavailable. Please try again in a minute.", reply_markup=unavailable_markup(service_id))
+        bot.answer_callback_query(call["id"], "🚫 Server temporarily unavailable")
         if progress_msg_id:
             try:
                 bot.delete_message(chat_id, progress_msg_id)
             except:
                 pass
         return
-    update_progress(bot, chat_id, progress_msg_id, 3)
 
     # Step 4 - call provider
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        raw = response.text
-    except Exception as e:
-        bot.send_message(chat_id, "🚫 Number not available on this service.", reply_markup=unavailable_markup(service_id))
+        result = provider.get_number(service.code, timeout=10)
+    except Exception:
+        result = None
+    update_progress(bot, chat_id, progress_msg_id, 4)
 
+    # Step 5 - check the provider handed out a number
+    if not result:
+        bot.send_message(chat_id, "🚫 Number not available on this service.", reply_markup=unavailable_markup(service_id))
         bot.answer_callback_query(call["id"], "🚫 Number not available on this  service")
         if progress_msg_id:
             try:
@@ -123,54 +130,17 @@ def handle(bot, call):
             except:
                 pass
         return
-    update_progress(bot, chat_id, progress_msg_id, 4)
-
-    # Step 5 - parse response
-    provider_order_id, number, parsed = None, None, {}
-    if connect.response_type == "Text":
-        parts = raw.strip().split(":")
-        if len(parts) >= 3 and parts[0] == "ACCESS_NUMBER":
-            provider_order_id, number = parts[1], parts[2]
-            parsed = {"id": provider_order_id, "phone": number}
-        else:
-            bot.send_message(chat_id, "🚫 Number not available on this service.", reply_markup=unavailable_markup(service_id))
-            if progress_msg_id:
-                try:
-                    bot.delete_message(chat_id, progress_msg_id)
-                except:
-                    pass
-            return
-    else:
-        try:
-            parsed = response.json()
-            provider_order_id = str(parsed.get("id") or parsed.get("order_id") or "")
-            number = parsed.get("phone") or parsed.get("number")
-            if not provider_order_id or not number:
-                bot.send_message(chat_id, "🚫 Number not available on this service.", reply_markup=unavailable_markup(service_id))
-
-                if progress_msg_id:
-                    try:
-                        bot.delete_message(chat_id, progress_msg_id)
-                    except:
-                        pass
-                return
-        except Exception:
-            if progress_msg_id:
-                try:
-                    bot.delete_message(chat_id, progress_msg_id)
-                except:
-                    pass
-            bot.send_message(chat_id, "🚫 Number not available on this service.", reply_markup=unavailable_markup(service_id))
-            return
+    provider_order_id, number, parsed = result
     update_progress(bot, chat_id, progress_msg_id, 5)
 
     # Step 6 - deduct balance + create order
-    user = User.objects(id=user.id, balance__gte=final_price).modify(dec__balance=final_price, new=True)
-    if not user:
+    updated = User.objects(id=user.id, balance__gte=final_price).modify(dec__balance=final_price, new=True)
+    if not updated:
+        user.reload()
         bot.send_message(
             chat_id,
             f"❌ Not enough balance at the moment. "
-            f"You have {User.objects(id=user.id).first().balance:.2f} 💎"
+            f"You have {user.balance:.2f} 💎"
         )
         if progress_msg_id:
             try:
@@ -178,6 +148,9 @@ def handle(bot, call):
             except:
                 pass
         return
+    user = updated
+    if ctx:
+        ctx.user = user
 
     order = Order(
         service=service,
@@ -248,6 +221,7 @@ def handle(bot, call):
     # OTP Watcher
     otpP = OtpPending(
         user=user,
+        order=order,
         phone=number,
         order_id=provider_order_id,
         url=connect.get_status_url,
@@ -258,12 +232,12 @@ def handle(bot, call):
         cancel_url=connect.cancel_url,
         next_otp_url=connect.next_number_url,
         responseType=connect.response_type,
+        api_id=str(connect.id),
     ).save()
 
-    notify_new_otp()
+    notify_new_otp(otpP, poll=not connect.push_enabled)
 
-    # Notify admins
-    admins = Admin.objects()
+    # Notify admins (queued, delivered in the background)
     admin_text = purchase_text.format(
         user_id=call["from"]["id"],
         service_name=service.name,
@@ -276,5 +250,8 @@ def handle(bot, call):
         price=final_price,
         balance=user.balance,
     )
-    for admin in admins:
-        bot.send_message(admin.telegram_id, admin_text)
+    notify_admins(
+        admin_text,
+        event="purchase",
+        detail=f"{service.name} ({service.server.name}) +{number} — {final_price} 💎 — user {user_id}",
+    )
@@ -3,28 +3,32 @@ import re, requests
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ForceReply
 from models.user import User
 from models.recharge import Recharge
-from models.payment_config import PaymentConfig
 from models.transaction import Transaction
 from bot.libs.helpers import safe_edit_message, is_admin
+from utils.config import get_payment_config
+from bot import sender
+from bot.libs.notify import notify_admins
 
 AMOUNTS = [100, 200, 500]
 
 
 def _cfg():
-    return PaymentConfig.objects().first()
+    return get_payment_config()
 
 
-def _ensure_user(bot, from_):
+def _ensure_user(bot, from_, ctx=None):
     uid = str(from_["id"])
-    user = User.objects(telegram_id=uid).first()
+    user = ctx.user if ctx else User.objects(telegram_id=uid).first()
     if not user:
         user = User(telegram_id=uid, username=from_.get("username", "")).save()
+        if ctx:
+            ctx.user = user
     return user
 
 
 # Entry point: user taps "Recharge"
-def menu(bot, call):
-    user = _ensure_user(bot, call["from"])
+def menu(bot, call, ctx=None):
+    user = _ensure_user(bot, call["from"], ctx)
     cfg = _cfg()
     if not cfg:
         bot.answer_callback_query(call["id"], "Payments not configured yet.")
@@ -163,12 +167,12 @@ def pay_callback(bot, call):
     bot.answer_callback_query(call["id"])
 
 
-def ask_utr_callback(bot, call):
+def ask_utr_callback(bot, call, ctx=None):
     # data: "utr:<amount>:<method>"
     _, amt, method = call["data"].split(":")
     amount = float(amt)
     chat_id = call["message"]["chat"]["id"]
-    user = _ensure_user(bot, call["from"])
+    user = _ensure_user(bot, call["from"], ctx)
 
     if method == "manual":
         r = Recharge(
@@ -312,11 +316,6 @@ def capture_utr_message(bot, message):
 
 
 def _notify_admins(bot, r: Recharge):
-    from models.admin import Admin
-
-    admins = Admin.objects()
-    if not admins:
-        return
     text = (
         "🆕 <b>Recharge Pending</b>\n\n"
         f"User: <code>{r.user.telegram_id}</code>\n"
@@ -329,13 +328,7 @@ def _notify_admins(bot, r: Recharge):
         InlineKeyboardButton("✅ Approve", callback_data=f"rcg:approve:{r.id}"),
         InlineKeyboardButton("❌ Reject", callback_data=f"rcg:reject:{r.id}"),
     )
-    for a in admins:
-        try:
-            bot.send_message(
-                int(a.telegram_id), text, parse_mode="HTML", reply_markup=kb
-            )
-        except Exception:
-            pass
+    notify_admins(text, parse_mode="HTML", reply_markup=kb)
 
 
 def action_callback(bot, call):
@@ -394,7 +387,7 @@ def action_callback(bot, call):
             chat_id=call["message"]["chat"]["id"],
             message_id=call["message"]["message_id"],
         )
-        bot.send_message(
+        sender.send_message(
             user.telegram_id,
             f"✅ Your recharge of {r.amount:.2f} 💎 via {r.method} has been approved.\n"
             f"New Balance: {user.balance:.2f} 💎",
@@ -408,8 +401,8 @@ def action_callback(bot, call):
             chat_id=call["message"]["chat"]["id"],
             message_id=call["message"]["message_id"],
         )
-        bot.send_message(
-            user.chat_id,
+        sender.send_message(
+            user.telegram_id,
             f"❌ Your recharge of {r.amount:.2f} 💎 via {r.method} has been rejected by admin.\n"
             f"If this is a mistake, please contact support.",
         )
@@ -26,6 +26,7 @@ def handle(bot, message):
             user.save()
         else:
             user.name = message["from"]["first_name"]
+            user.reachable = True  # talking to us again -> back in broadcast audience
             user.save()
 
         balance = user.balance
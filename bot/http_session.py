@@ -0,0 +1,60 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+# ===========================
+# Pooled keep-alive session for the Bot API
+# ===========================
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))
+CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+
+# Read timeouts per Bot API method; anything else uses READ_TIMEOUT
+METHOD_READ_TIMEOUTS = {
+    "answerCallbackQuery": 5,
+    "getChatMember": 5,
+    "deleteMessage": 5,
+    "editMessageText": 8,
+    "sendMessage": 10,
+    "sendPhoto": 30,
+    "sendDocument": 30,
+}
+
+session = None
+
+
+def _build_session() -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=False)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"Connection": "keep-alive"})
+    return s
+
+
+def _send(method, url, params=None, files=None, timeout=None, proxies=None):
+    api_method = url.rsplit("/", 1)[-1]
+    connect_timeout = CONNECT_TIMEOUT
+    read_timeout = METHOD_READ_TIMEOUTS.get(api_method, READ_TIMEOUT)
+    # apihelper always passes (CONNECT_TIMEOUT, READ_TIMEOUT); only a read
+    # timeout other than its default was asked for by the caller (e.g. long polling)
+    if isinstance(timeout, tuple) and timeout[1] and timeout[1] != apihelper.READ_TIMEOUT:
+        read_timeout = timeout[1]
+    return session.request(method, url, params=params, files=files,
+                           timeout=(connect_timeout, read_timeout), proxies=proxies)
+
+
+def install_session():
+    """
+    Route every TeleBot call through one pooled keep-alive session.
+    Safe to call more than once; urllib3's pool is shared across threads.
+    """
+    global session
+    if session is not None:
+        return session
+    session = _build_session()
+    apihelper.session = session
+    apihelper.CUSTOM_REQUEST_SENDER = _send
+    return session
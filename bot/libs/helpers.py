@@ -45,8 +45,8 @@ def safe_edit_message(bot, call, new_text, new_markup):
     except Exception:
         pass  
 
-from models.admin import Admin
+from utils.registry import is_admin_id
 
 
 def is_admin(user_id: str) -> bool:
-    return Admin.objects(telegram_id=user_id).first() is not None
\ No newline at end of file
+    return is_admin_id(user_id)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import json
+import time
+
+from bot import sender
+from utils.redis_client import redis_client
+from utils.registry import admin_ids, admin_settings
+
+# ===========================
+# Admin notifications (+ optional digest)
+# ===========================
+# Event types that admins can batch into a digest or mark as urgent.
+EVENT_LABELS = {
+    "purchase": "🛒 Purchases",
+    "cancel": "🚫 Cancellations",
+    "otp": "💭 OTPs received",
+    "auto_cancel": "⏳ Auto-cancels",
+}
+DIGEST_KEY = "digest:{admin_id}"
+DIGEST_SINCE_KEY = "digest:{admin_id}:since"
+MAX_MESSAGE_LEN = 4000
+
+
+def _wants_digest(settings: dict, event: str) -> bool:
+    if not event or event not in EVENT_LABELS:
+        return False
+    if event in settings.get("urgent_events", ()):
+        return False
+    return bool(settings.get("digest_interval") or settings.get("digest_max_events"))
+
+
+def notify_admins(text: str, event: str = None, detail: str = None, **kwargs):
+    """
+    Queue `text` for every admin. Delivery happens in the background
+    sender, so the caller only pays for one Redis round trip.
+
+    With `event` (see EVENT_LABELS) and a one-line `detail`, admins who
+    enabled digest mode get the event batched into their next summary
+    instead, unless they marked that event type as urgent.
+    """
+    sends = []
+    digest = []
+    for admin_id in admin_ids():
+        settings = admin_settings(admin_id)
+        if detail and _wants_digest(settings, event):
+            digest.append((admin_id, settings))
+        else:
+            sends.append(("send_message", dict(chat_id=admin_id, text=text, **kwargs)))
+
+    sender.enqueue_many(sends)
+    if digest:
+        _add_to_digests(digest, event, detail)
+
+
+def _add_to_digests(admins: list, event: str, detail: str):
+    entry = json.dumps({"event": event, "detail": detail, "ts": time.time()})
+    pipe = redis_client.pipeline(transaction=False)
+    for admin_id, _ in admins:
+        pipe.rpush(DIGEST_KEY.format(admin_id=admin_id), entry)
+        pipe.set(DIGEST_SINCE_KEY.format(admin_id=admin_id), time.time(), nx=True)
+    results = pipe.execute()
+
+    # RPUSH results are at even positions: the new digest length
+    for (admin_id, settings), count in zip(admins, results[::2]):
+        max_events = settings.get("digest_max_events") or 0
+        if max_events and count >= max_events:
+            flush_digest(admin_id)
+
+
+def _build_digest(entries: list, since: float) -> str:
+    counts = {}
+    for e in entries:
+        counts[e["event"]] = counts.get(e["event"], 0) + 1
+
+    minutes = max(1, int((time.time() - since) / 60)) if since else 1
+    lines = [f"📊 <b>Activity Digest</b> (last {minutes} min)\n"]
+    for event, label in EVENT_LABELS.items():
+        if counts.get(event):
+            lines.append(f"{label}: <b>{counts[event]}</b>")
+    lines.append("")
+
+    text = "\n".join(lines)
+    for i, e in enumerate(entries):
+        line = f"\n• {e['detail']}"
+        if len(text) + len(line) > MAX_MESSAGE_LEN:
+            text += f"\n… and {len(entries) - i} more"
+            break
+        text += line
+    return text
+
+
+def flush_digest(admin_id: str):
+    """Atomically take an admin's pending events and queue one summary."""
+    key = DIGEST_KEY.format(admin_id=admin_id)
+    since_key = DIGEST_SINCE_KEY.format(admin_id=admin_id)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lrange(key, 0, -1)
+    pipe.get(since_key)
+    pipe.delete(key, since_key)
+    raw_entries, since, _ = pipe.execute()
+    if not raw_entries:
+        return
+
+    entries = [json.loads(r) for r in raw_entries]
+    sender.send_message(admin_id, _build_digest(entries, float(since or 0)))
+
+
+def flush_due_digests():
+    """Send digests whose interval elapsed. Run periodically by the sender leader."""
+    now = time.time()
+    for admin_id in admin_ids():
+        settings = admin_settings(admin_id)
+        interval = settings.get("digest_interval") or 0
+        since = redis_client.get(DIGEST_SINCE_KEY.format(admin_id=admin_id))
+        if since is None:
+            continue
+        if interval:
+            due = now - float(since) >= interval
+        else:
+            # count-only digests flush in notify_admins; with both off this
+            # sends the leftovers of an admin who switched digest mode off
+            due = not settings.get("digest_max_events")
+        if due:
+            flush_digest(admin_id)
+
+
+sender.register_periodic(flush_due_digests)
@@ -0,0 +1,23 @@
+import os
+from dotenv import load_dotenv
+from telebot import TeleBot
+from mongoengine import connect
+
+from bot.http_session import install_session
+
+
+def create_bot() -> TeleBot:
+    """
+    Load env vars, connect MongoDB and build the TeleBot instance.
+    Shared by the Flask app and the standalone consumer processes.
+    """
+    load_dotenv()
+    bot_token = os.getenv("BOT_TOKEN")
+    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/virtualsim")
+
+    if not bot_token:
+        raise RuntimeError("BOT_TOKEN environment variable is required")
+
+    connect(host=mongo_uri)
+    install_session()
+    return TeleBot(bot_token, parse_mode="HTML")
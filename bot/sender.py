@@ -0,0 +1,523 @@
+import json
+import logging
+import threading
+import time
+import uuid
+
+from cachetools import TTLCache
+from telebot.apihelper import ApiTelegramException
+
+from bot.executor import ShardedExecutor
+from utils.redis_client import redis_client
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# Outbound Telegram send queue
+# ===========================
+# Fire-and-forget sends (notifications, OTP deliveries, broadcasts) are
+# persisted in Redis and drained by one leader process that respects
+# Telegram's limits: ~30 msg/s overall, 1 msg/s per private chat and
+# 20 msg/min per group. 429s are retried after `retry_after`.
+# The overall limit and 429 pauses are kept in Redis, so the leader and
+# every send_now() caller (broadcasts) share them across processes.
+OUTBOX_KEY = "outbox:telegram"
+PROCESSING_KEY = "outbox:processing"
+DELAYED_KEY = "outbox:delayed"
+CHAT_QUEUE_KEY = "outbox:chat:"       # + chat id: that chat's parked items, oldest first
+DEAD_KEY = "outbox:dead"              # items that can never be sent, kept for inspection
+LOCK_KEY = "outbox_sender_lock"
+LOCK_TTL = 30
+GLOBAL_BUCKET_KEY = "outbox:global_bucket"
+PAUSE_KEY = "outbox:paused"
+
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+GROUP_RATE = 20.0 / 60
+MAX_ATTEMPTS = 5
+
+# Sends run on SEND_THREADS threads (one RTT each would cap a single thread
+# well below GLOBAL_RATE); items are sharded by chat so a chat's order holds.
+SEND_THREADS = 8
+SEND_QUEUE = 20             # items buffered per send thread
+OWNERSHIP_CHECK = 1.0       # re-check the leader lock before a send if older than this
+
+ALLOWED_METHODS = {"send_message", "edit_message_text", "delete_message"}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        """Take one token. Returns 0 on success, else seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+# Cluster-wide token bucket on Redis time. ARGV = rate, capacity.
+# Returns "0" when a token was taken, else the seconds to wait (a 429
+# pause set by any process counts as a wait).
+_global_take_script = redis_client.register_script("""
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local paused = redis.call('PTTL', KEYS[2])
+if paused > 0 then
+    return tostring(paused / 1000)
+end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 60)
+return tostring(wait)
+""")
+
+# Extend a 429 pause, never shorten it. ARGV = milliseconds
+_pause_script = redis_client.register_script("""
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[1])
+end
+""")
+
+
+def _is_group(chat_id) -> bool:
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        return True   # "@channelname": use the slower rate
+
+
+class RateLimiter:
+    """
+    Global bucket (shared in Redis) plus one bucket per chat (groups get the
+    slower group rate). Falls back to an in-process global bucket while
+    Redis is unreachable.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE)
+        self.chat_buckets = TTLCache(maxsize=100000, ttl=120)
+        self.paused_until = 0.0
+        self.local_only = False
+        self.lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        with self.lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                rate = GROUP_RATE if _is_group(chat_id) else CHAT_RATE
+                bucket = self.chat_buckets[chat_id] = TokenBucket(rate, capacity=1)
+            return bucket
+
+    def _take_global(self) -> float:
+        try:
+            wait = float(_global_take_script(keys=[GLOBAL_BUCKET_KEY, PAUSE_KEY],
+                                             args=[GLOBAL_RATE, max(1.0, GLOBAL_RATE)]))
+            self.local_only = False
+            return wait
+        except Exception as e:
+            if not self.local_only:
+                logger.warning("Shared rate limit unavailable, using local bucket: %s", e)
+                self.local_only = True
+            pause = self.paused_until - time.monotonic()
+            return pause if pause > 0 else self.global_bucket.take()
+
+    def chat_wait(self, chat_id) -> float:
+        """Take a per-chat token, or return how long this chat must wait."""
+        if chat_id is None:
+            return 0.0
+        return self._chat_bucket(chat_id).take()
+
+    def acquire_global(self, keepalive=None):
+        """
+        Block until a global token is available (honours a 429 pause).
+        `keepalive()` runs at least once a second while waiting.
+        """
+        while True:
+            if keepalive:
+                keepalive()
+            wait = self._take_global()
+            if not wait:
+                return
+            time.sleep(min(wait, 1.0) if keepalive else wait)
+
+    def acquire(self, chat_id):
+        """Block until both the chat and the global bucket allow one send."""
+        while True:
+            wait = self.chat_wait(chat_id)
+            if not wait:
+                break
+            time.sleep(wait)
+        self.acquire_global()
+
+    def pause(self, seconds: float):
+        """Stop every process's global sends for `seconds` (after a 429)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        try:
+            _pause_script(keys=[PAUSE_KEY], args=[int(seconds * 1000)])
+        except Exception as e:
+            logger.warning("Could not share 429 pause: %s", e)
+
+
+limiter = RateLimiter()
+bot_instance = None
+sender_thread = None
+_sender_lock = threading.Lock()
+_periodic = []
+PERIODIC_EVERY = 1.0
+
+
+def register_periodic(fn):
+    """Run `fn()` about once a second in the leader process (e.g. digest flushes)."""
+    if fn not in _periodic:
+        _periodic.append(fn)
+
+
+def _run_periodic():
+    for fn in list(_periodic):
+        try:
+            fn()
+        except Exception as e:
+            logger.warning("Periodic sender task %s failed: %s", fn.__name__, e)
+
+
+def _retry_after(e: ApiTelegramException):
+    if e.error_code != 429:
+        return None
+    try:
+        return float(e.result_json.get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        return 1.0
+
+
+def _serialize(kwargs: dict) -> dict:
+    markup = kwargs.get("reply_markup")
+    if markup is not None and hasattr(markup, "to_json"):
+        kwargs["reply_markup"] = markup.to_json()
+    return kwargs
+
+
+def send_now(bot, method: str, max_attempts: int = MAX_ATTEMPTS, **kwargs):
+    """
+    Send synchronously through the shared limiter, sleeping on 429s.
+    Raises the last ApiTelegramException for permanent errors.
+    """
+    chat_id = kwargs.get("chat_id")
+    for attempt in range(max_attempts):
+        limiter.acquire(chat_id)
+        try:
+            result = getattr(bot, method)(**kwargs)
+            metrics.incr("outbox_sent")
+            return result
+        except ApiTelegramException as e:
+            retry_after = _retry_after(e)
+            if retry_after is None or attempt == max_attempts - 1:
+                raise
+            metrics.incr("outbox_retried")
+            limiter.pause(retry_after)
+
+
+def _item(method: str, kwargs: dict) -> str:
+    if method not in ALLOWED_METHODS:
+        raise ValueError(f"Unsupported outbox method: {method}")
+    return json.dumps({"method": method, "kwargs": _serialize(kwargs), "ts": time.time(), "attempts": 0})
+
+
+def enqueue(method: str, **kwargs):
+    """Persist a send for the background sender. Returns immediately."""
+    redis_client.lpush(OUTBOX_KEY, _item(method, kwargs))
+
+
+def enqueue_many(sends: list):
+    """Persist several (method, kwargs) sends in one round trip."""
+    if sends:
+        redis_client.lpush(OUTBOX_KEY, *[_item(method, dict(kwargs)) for method, kwargs in sends])
+
+
+def send_message(chat_id, text, **kwargs):
+    enqueue("send_message", chat_id=chat_id, text=text, **kwargs)
+
+
+def outbox_depth() -> int:
+    """Queued items plus delayed entries (a waiting chat counts once)."""
+    return redis_client.llen(OUTBOX_KEY) + redis_client.zcard(DELAYED_KEY)
+
+
+# ===========================
+# Drainer (one leader per cluster)
+# ===========================
+# Per-chat FIFO: a chat's parked items wait in CHAT_QUEUE_KEY<chat id> and
+# DELAYED_KEY holds one "chat:<chat id>" entry due when its head may go out.
+# Only the head is ever promoted, and new items for a chat with a queue join
+# its tail, so a chat's messages leave in the order they were queued. Items
+# without a chat are delayed in DELAYED_KEY directly.
+_promote_script = redis_client.register_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for i = #due, 1, -1 do
+    local member = due[i]
+    redis.call('ZREM', KEYS[1], member)
+    if string.sub(member, 1, 5) == 'chat:' then
+        local raw = redis.call('LPOP', ARGV[2] .. string.sub(member, 6))
+        if raw then
+            redis.call('RPUSH', KEYS[2], raw)
+        end
+    else
+        redis.call('RPUSH', KEYS[2], member)
+    end
+end
+return #due
+""")
+
+
+def _chat_interval(chat_id) -> float:
+    return 1 / (GROUP_RATE if _is_group(chat_id) else CHAT_RATE)
+
+
+def _delay(raw: bytes, item: dict, seconds: float, behind: bool = False):
+    """
+    Park an item for `seconds`. It goes to the head of its chat's queue (it is
+    older than anything parked there) unless `behind`: a new item for a chat
+    that already has a queue waits at its tail.
+    """
+    chat_id = item["kwargs"].get("chat_id")
+    pipe = redis_client.pipeline(transaction=False)
+    if chat_id is None:
+        pipe.zadd(DELAYED_KEY, {json.dumps(item): time.time() + seconds})
+    else:
+        item["queued"] = True
+        queue = f"{CHAT_QUEUE_KEY}{chat_id}"
+        if behind:
+            pipe.rpush(queue, json.dumps(item))
+            pipe.zadd(DELAYED_KEY, {f"chat:{chat_id}": time.time() + seconds}, nx=True)
+        else:
+            pipe.lpush(queue, json.dumps(item))
+            pipe.zadd(DELAYED_KEY, {f"chat:{chat_id}": time.time() + seconds})
+    pipe.lrem(PROCESSING_KEY, 1, raw)
+    pipe.execute()
+
+
+def _next_in_chat(chat_id):
+    """A chat's queued item went out: schedule the next one, if any."""
+    if redis_client.exists(f"{CHAT_QUEUE_KEY}{chat_id}"):
+        redis_client.zadd(DELAYED_KEY, {f"chat:{chat_id}": time.time() + _chat_interval(chat_id)})
+
+
+def _promote_delayed():
+    """Move delayed items whose time has come back onto the popping end of the outbox."""
+    _promote_script(keys=[DELAYED_KEY, OUTBOX_KEY], args=[time.time(), CHAT_QUEUE_KEY])
+
+
+def _deliver(raw: bytes):
+    item = json.loads(raw)
+    chat_id = item["kwargs"].get("chat_id")
+    queued = item.get("queued", False)
+
+    # older items for this chat are parked: keep the chat's order
+    if chat_id is not None and not queued and redis_client.exists(f"{CHAT_QUEUE_KEY}{chat_id}"):
+        _delay(raw, item, _chat_interval(chat_id), behind=True)
+        return
+
+    # a busy chat must not block everyone else: park it instead of sleeping
+    wait = limiter.chat_wait(chat_id)
+    if wait:
+        _delay(raw, item, wait)
+        return
+
+    # A 429 pause can outlast LOCK_TTL: keep the lock, and never send after losing it
+    limiter.acquire_global(keepalive=lambda: _hold_leadership(LOCK_TTL / 3))
+    _hold_leadership(OWNERSHIP_CHECK)
+    try:
+        getattr(bot_instance, item["method"])(**item["kwargs"])
+        metrics.incr("outbox_sent")
+        metrics.observe("outbox_lag_seconds", time.time() - item["ts"])
+        redis_client.lrem(PROCESSING_KEY, 1, raw)
+        if queued:
+            _next_in_chat(chat_id)
+    except ApiTelegramException as e:
+        retry_after = _retry_after(e)
+        item["attempts"] += 1
+        if retry_after is not None and item["attempts"] < MAX_ATTEMPTS:
+            limiter.pause(retry_after)
+            metrics.incr("outbox_retried")
+            _delay(raw, item, retry_after)
+        elif e.error_code >= 500 and item["attempts"] < MAX_ATTEMPTS:
+            metrics.incr("outbox_retried")
+            _delay(raw, item, 2 ** item["attempts"])
+        else:
+            metrics.incr("outbox_dropped")
+            logger.warning("Dropping outbox %s to %s: %s", item["method"], chat_id, e)
+            redis_client.lrem(PROCESSING_KEY, 1, raw)
+            if queued:
+                _next_in_chat(chat_id)
+    except Exception as e:
+        item["attempts"] += 1
+        if item["attempts"] < MAX_ATTEMPTS:
+            metrics.incr("outbox_retried")
+            _delay(raw, item, 2 ** item["attempts"])
+        else:
+            metrics.incr("outbox_dropped")
+            logger.warning("Dropping outbox %s to %s: %s", item["method"], chat_id, e)
+            redis_client.lrem(PROCESSING_KEY, 1, raw)
+            if queued:
+                _next_in_chat(chat_id)
+
+
+def _park(raw, e):
+    """Move an item that can never be sent out of the way of the drainer."""
+    metrics.incr("outbox_dropped")
+    logger.warning("Parking undeliverable outbox item in %s: %s", DEAD_KEY, e)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.lpush(DEAD_KEY, raw)
+    pipe.ltrim(DEAD_KEY, 0, 999)
+    pipe.lrem(PROCESSING_KEY, 1, raw)
+    pipe.execute()
+    chat_id = _chat_of(raw)
+    if chat_id is not None:
+        _next_in_chat(chat_id)   # do not strand the items queued behind it
+
+
+class _LostLeadership(Exception):
+    pass
+
+
+_leadership = {"token": None, "checked": 0.0}
+_leadership_lost = threading.Event()
+
+
+def _hold_leadership(max_age: float):
+    """Extend the leader lock if it was last confirmed over `max_age` seconds ago."""
+    if _leadership_lost.is_set():
+        raise _LostLeadership()
+    if time.monotonic() - _leadership["checked"] < max_age:
+        return
+    try:
+        held = _refresh_lock_script(keys=[LOCK_KEY], args=[_leadership["token"], LOCK_TTL])
+    except Exception as e:
+        logger.warning("Could not refresh the outbox sender lock: %s", e)
+        held = False   # unknown is as good as lost: do not risk a double send
+    if not held:
+        _leadership_lost.set()
+        raise _LostLeadership()
+    _leadership["checked"] = time.monotonic()
+
+
+def _process(raw: bytes):
+    try:
+        _deliver(raw)
+    except _LostLeadership:
+        pass   # left in PROCESSING: the next leader sends it
+    except Exception as e:
+        # Malformed item (bad JSON, unusable chat id): never retry it
+        _park(raw, e)
+
+
+def _chat_of(raw: bytes):
+    try:
+        return json.loads(raw)["kwargs"].get("chat_id")
+    except Exception:
+        return None
+
+
+def _pop():
+    """Next outbox item; waits at most until the next delayed item is due (max 1s)."""
+    head = redis_client.zrange(DELAYED_KEY, 0, 0, withscores=True)
+    wait = head[0][1] - time.time() if head else 1
+    if wait >= 1:
+        return redis_client.brpoplpush(OUTBOX_KEY, PROCESSING_KEY, timeout=1)
+    # BRPOPLPUSH timeouts below 1s are not portable (0 blocks forever)
+    raw = redis_client.rpoplpush(OUTBOX_KEY, PROCESSING_KEY)
+    if raw is None:
+        time.sleep(min(max(wait, 0.005), 0.1))
+    return raw
+
+
+def _drain(token: str):
+    # Items left in PROCESSING by a crashed leader are sent again
+    while redis_client.rpoplpush(PROCESSING_KEY, OUTBOX_KEY):
+        pass
+
+    _leadership.update(token=token, checked=time.monotonic())
+    _leadership_lost.clear()
+    pool = ShardedExecutor(_process, shards=SEND_THREADS, max_pending=SEND_QUEUE)
+    last_periodic = time.monotonic()
+    try:
+        while not _leadership_lost.is_set():
+            _promote_delayed()
+            if time.monotonic() - last_periodic >= PERIODIC_EVERY:
+                _run_periodic()
+                last_periodic = time.monotonic()
+            raw = _pop()
+            if raw:
+                pool.submit(_chat_of(raw), raw)
+            _hold_leadership(LOCK_TTL / 3)
+    except _LostLeadership:
+        pass
+    finally:
+        pool.shutdown()
+    logger.warning("Outbox sender lost leadership")
+
+
+# The lock holds the leader's token; only the holder may extend or delete it
+_refresh_lock_script = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+_release_lock_script = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+def _run_sender():
+    while True:
+        try:
+            token = uuid.uuid4().hex
+            if redis_client.set(LOCK_KEY, token, ex=LOCK_TTL, nx=True):
+                try:
+                    _drain(token)
+                finally:
+                    _release_lock_script(keys=[LOCK_KEY], args=[token])
+        except Exception as e:
+            logger.warning("Outbox sender error: %s", e)
+        # standby: another process is the leader
+        time.sleep(LOCK_TTL / 3)
+
+
+def start_sender(bot):
+    """Start the background sender in this process (standby if another leads)."""
+    global bot_instance, sender_thread
+    with _sender_lock:
+        bot_instance = bot
+        if sender_thread and sender_thread.is_alive():
+            return
+        sender_thread = threading.Thread(target=_run_sender, daemon=True)
+        sender_thread.start()
@@ -0,0 +1,61 @@
+import json
+import time
+
+from utils.redis_client import redis_client
+from utils import metrics
+
+# ===========================
+# Raw update queue (webhook -> consumers)
+# ===========================
+# Popping moves the update to PROCESSING_KEY; it is removed from there only
+# after it was handled (ack_update), so a consumer crash does not lose it.
+QUEUE_KEY = "updates:queue"
+PROCESSING_KEY = "updates:processing"
+
+# Newest first from processing onto the consumer end, so the oldest pops first
+_requeue_script = redis_client.register_script("""
+local moved = 0
+local raw = redis.call('LPOP', KEYS[1])
+while raw do
+    redis.call('RPUSH', KEYS[2], raw)
+    moved = moved + 1
+    raw = redis.call('LPOP', KEYS[1])
+end
+return moved
+""")
+
+
+def enqueue_update(update: dict) -> int:
+    """Push a raw Telegram update. Returns the queue depth after the push."""
+    payload = json.dumps({"ts": time.time(), "update": update})
+    depth = redis_client.lpush(QUEUE_KEY, payload)
+    metrics.incr("updates_enqueued")
+    return depth
+
+
+def pop_update(timeout: int = 5):
+    """
+    Block up to `timeout` seconds for the oldest update.
+    Returns (raw, update) — pass `raw` to ack_update once handled — or None.
+    Records how long the update waited in the queue.
+    """
+    raw = redis_client.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=timeout)
+    if not raw:
+        return None
+    payload = json.loads(raw)
+    metrics.observe("update_wait_seconds", time.time() - payload.get("ts", time.time()))
+    return raw, payload.get("update")
+
+
+def ack_update(raw):
+    """Forget a handled update (successfully or not)."""
+    redis_client.lrem(PROCESSING_KEY, 1, raw)
+
+
+def requeue_unacked() -> int:
+    """Put updates left in processing by a stopped consumer back at the head of the queue."""
+    return _requeue_script(keys=[PROCESSING_KEY, QUEUE_KEY])
+
+
+def queue_depth() -> int:
+    return redis_client.llen(QUEUE_KEY)
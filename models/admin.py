@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, DateTimeField
+from mongoengine import Document, StringField, DateTimeField, IntField, ListField
 from datetime import datetime
 
 
@@ -7,4 +7,9 @@ class Admin(Document):
     name = StringField()  # Optional name/username
     created_at = DateTimeField(default=datetime.utcnow)
 
+    # Notification digest: 0 = send every event immediately
+    digest_interval = IntField(default=0)      # seconds between summaries
+    digest_max_events = IntField(default=0)    # flush early after N events (0 = no limit)
+    urgent_events = ListField(StringField(), default=[])  # always sent immediately
+
     meta = {"collection": "admins"}
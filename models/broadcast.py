@@ -0,0 +1,30 @@
+# models/broadcast.py
+import datetime
+from mongoengine import Document, StringField, IntField, DateTimeField, ObjectIdField, BooleanField
+
+
+class Broadcast(Document):
+    """
+    A broadcast job. Users are walked in `_id` order; `cursor` is the last
+    user `_id` fully processed, so a job can resume after a crash.
+    """
+    text = StringField(required=True)
+    created_by = StringField()              # admin telegram id
+    chat_id = IntField()                    # where the progress message lives
+    status_message_id = IntField()
+    include_unreachable = BooleanField(default=False)
+
+    status = StringField(choices=[
+        "pending", "running", "paused", "cancelled", "done"
+    ], default="pending")
+    cursor = ObjectIdField()
+    total = IntField(default=0)
+    sent_count = IntField(default=0)
+    failed_count = IntField(default=0)
+    unreachable_count = IntField(default=0)    # newly marked unreachable
+
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.datetime.utcnow)
+    finished_at = DateTimeField()
+
+    meta = {"collection": "broadcasts", "indexes": ["status"]}
@@ -4,6 +4,7 @@ import datetime
 
 class OtpPending(Document):
     user = ReferenceField("User")
+    order = ReferenceField("Order")
     phone = StringField()
     order_id = StringField()
     url = StringField()
@@ -14,4 +15,8 @@ class OtpPending(Document):
     message_id = IntField()
     cancelTime = IntField()
     responseType = StringField(choices=["Text", "JSON"], default="Text")
-    created_at = DateTimeField(default=datetime.datetime.utcnow)
\ No newline at end of file
+    api_id = StringField()   # ConnectApi id, used to group bulk status polls
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    last_activity_at = DateTimeField()   # last next-number request; resets fast polling
+
+    meta = {"indexes": [("api_id", "order_id")]}   # push callbacks look orders up by provider id
\ No newline at end of file
@@ -0,0 +1,22 @@
+# models/provider_stat.py
+from mongoengine import Document, StringField, IntField, FloatField, DateTimeField, DictField
+
+
+class ProviderStat(Document):
+    """
+    Hourly roll-up of provider calls for one ConnectApi and one operation
+    (get_number, status, bulk_status, next_sms, cancel, first_otp).
+    """
+    api_id = StringField(required=True)
+    op = StringField(required=True)
+    hour = DateTimeField(required=True)     # UTC, start of the hour
+
+    calls = IntField(default=0)
+    ok = IntField(default=0)
+    latency_sum = FloatField(default=0)     # seconds
+    latency_hist = DictField()              # "le_<ms>" / "le_inf" -> calls
+
+    meta = {
+        "collection": "provider_stats",
+        "indexes": [{"fields": ["api_id", "op", "hour"], "unique": True}, "hour"],
+    }
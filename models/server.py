@@ -25,7 +25,22 @@ class ConnectApi(Document):
     next_number_url = URLField(required=True)
     cancel_url = URLField(required=True)
     auto_cancel_time = IntField(default=5)
-    retry_time = IntField(default=0)
+    retry_time = IntField(default=0)   # minimum seconds between two status polls
+
+    # Polling cadence: fast right after purchase / a next-number request,
+    # then the interval grows by poll_backoff every fast_poll_window seconds
+    fast_poll_interval = FloatField(default=1)
+    fast_poll_window = IntField(default=20)
+    poll_backoff = FloatField(default=2)
+    max_poll_interval = FloatField(default=10)
+
+    # Optional: one call returning the status of every active activation
+    bulk_status_url = StringField()
+    bulk_status_parser = StringField(choices=["sms_activate", "json_map"], default="sms_activate")
+
+    # Provider POSTs incoming SMS to /webhooks/otp/<id>; orders are not polled
+    push_enabled = BooleanField(default=False)
+    push_secret = StringField()
 
     def __str__(self):
         return f"{self.api_name} ({self.server.name})"
@@ -9,4 +9,8 @@ class User(Document):
     balance = FloatField(default=0.0)
     total_recharged = FloatField(default=0)
     blocked = BooleanField(default=False) # new
-    created_at = DateTimeField(default=datetime.datetime.utcnow)
\ No newline at end of file
+    reachable = BooleanField(default=True)  # False after 403 / chat not found
+    last_failed_at = DateTimeField()
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+
+    meta = {"indexes": [("blocked", "reachable", "id")]}  # broadcast audience, walked in _id order
\ No newline at end of file
@@ -0,0 +1,72 @@
+import logging
+import threading
+
+from bson import ObjectId
+
+from models.server import ConnectApi
+from providers.base import Provider
+from providers.generic import GenericProvider
+from utils import breaker, events
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# Provider cache
+# ===========================
+# One provider per ConnectApi id, built (URL templates bound, parsers picked)
+# on first use. Admin edits publish "api_changed" to drop it in every process.
+_providers = {}
+_providers_lock = threading.Lock()
+_subscribed = False
+
+
+def _on_api_changed(api_id=None):
+    with _providers_lock:
+        if api_id:
+            _providers.pop(str(api_id), None)
+        else:
+            _providers.clear()
+
+
+def invalidate_provider(api_id=None):
+    """Rebuild the provider for `api_id` (or all) on next use, in every process."""
+    _on_api_changed(api_id)
+    events.publish("api_changed", api_id=str(api_id) if api_id else None)
+
+
+def get_provider(api):
+    """
+    Cached provider for a ConnectApi document or id; None if the API does not
+    exist. Raises ValueError if its URL templates cannot be parsed; the API's
+    breaker is opened so callers back off until an admin fixes it.
+    """
+    global _subscribed
+    if not api:
+        return None
+    api_id = str(api.id) if isinstance(api, ConnectApi) else str(api)
+    provider = _providers.get(api_id)
+    if provider is not None:
+        return provider
+
+    with _providers_lock:
+        if not _subscribed:
+            events.subscribe("api_changed", _on_api_changed)
+            # Changes published while the listener was reconnecting were missed
+            events.subscribe(events.RESUBSCRIBED, _on_api_changed)
+            _subscribed = True
+        provider = _providers.get(api_id)
+        if provider is None:
+            if not isinstance(api, ConnectApi):
+                api = ConnectApi.objects(id=api_id).first() if ObjectId.is_valid(api_id) else None
+            if api is None:
+                return None
+            try:
+                provider = _providers[api_id] = GenericProvider.from_api(api)
+            except ValueError as e:
+                logger.error("API %s has a bad URL template: %s", api_id, e)
+                breaker.trip(api_id, f"bad URL template: {e}")
+                raise
+    return provider
+
+
+__all__ = ["Provider", "GenericProvider", "get_provider", "invalidate_provider"]
@@ -0,0 +1,91 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import breaker, telemetry
+
+# ===========================
+# Shared provider HTTP
+# ===========================
+POOL_SIZE = 32
+HOST_CONCURRENCY = 8      # max in-flight requests per provider host
+DEFAULT_TIMEOUT = 5
+
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_maxsize=POOL_SIZE))
+_http.mount("http://", HTTPAdapter(pool_maxsize=POOL_SIZE))
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(HOST_CONCURRENCY)
+    return slot
+
+
+class Provider(ABC):
+    """
+    One SMS provider account. Each method makes a single HTTP call and returns
+    parsed data; transport errors and non-2xx responses raise. bulk_status is
+    optional: providers that implement it set supports_bulk.
+    """
+
+    supports_bulk = False
+
+    def __init__(self, api_id=None, headers=None):
+        self.api_id = str(api_id) if api_id else None
+        self.headers = headers or {}
+
+    @abstractmethod
+    def get_number(self, service_code: str, timeout: float = 10):
+        """Buy a number: (order_id, phone, raw) or None if none was given."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_status(self, order_id: str):
+        """(otp_token, raw) once the provider has a code, else (None, None)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def cancel(self, order_id: str) -> bool:
+        """True if the provider confirmed (or does not need) the cancellation."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def next_sms(self, order_id: str) -> bool:
+        """Ask for another SMS on the number; False if the provider has no such call."""
+        raise NotImplementedError
+
+    def bulk_status(self) -> dict:
+        """{order_id: (otp_token, raw)} for every active order that has a code."""
+        raise NotImplementedError(f"{type(self).__name__} has no bulk status call")
+
+    def _get(self, url: str, op: str = None, timeout: float = DEFAULT_TIMEOUT):
+        """
+        GET on the shared keep-alive session, capped per host. The outcome
+        feeds this API's circuit breaker and, under `op`, its telemetry.
+        """
+        start = time.monotonic()
+        try:
+            with _host_slot(url):
+                resp = _http.get(url, headers=self.headers, timeout=timeout)
+            resp.raise_for_status()
+        except Exception:
+            self._record(op, False, time.monotonic() - start)
+            raise
+        self._record(op, True, time.monotonic() - start)
+        return resp
+
+    def _record(self, op, ok: bool, latency: float):
+        breaker.record(self.api_id, ok, latency)
+        if op:
+            telemetry.record(self.api_id, op, ok, latency)
@@ -0,0 +1,202 @@
+import string
+import time
+
+from providers.base import Provider
+from utils import telemetry
+
+
+# ===========================
+# Response parsers (picked once per provider, by response type)
+# ===========================
+def _number_text(resp):
+    parts = resp.text.strip().split(":")
+    if len(parts) >= 3 and parts[0] == "ACCESS_NUMBER":
+        return parts[1], parts[2], {"id": parts[1], "phone": parts[2]}
+    return None
+
+
+def _number_json(resp):
+    data = resp.json()
+    order_id = str(data.get("id") or data.get("order_id") or "")
+    phone = data.get("phone") or data.get("number")
+    if order_id and phone:
+        return order_id, str(phone), data
+    return None
+
+
+def _status_text(resp):
+    raw = resp.text.strip()
+    if raw.startswith("STATUS_OK") or raw.startswith("ACCESS_OTP") or "OTP" in raw:
+        parts = raw.split(":")
+        return (parts[1] if len(parts) > 1 else raw), {"text": raw}
+    return None, None
+
+
+def _status_json(resp):
+    data = resp.json()
+    otp_token = data.get("otp") or data.get("sms")
+    if otp_token:
+        return str(otp_token), data
+    return None, None
+
+
+def _cancel_text(resp) -> bool:
+    return resp.text.strip().startswith(("ACCESS_CANCEL", "NO_ACTIVATION"))
+
+
+def _cancel_json(resp) -> bool:
+    return True
+
+
+def _bulk_sms_activate(resp) -> dict:
+    """{"activeActivations": [{"activationId": .., "smsCode": [..], "smsText": ..}]}"""
+    results = {}
+    for entry in (resp.json() or {}).get("activeActivations") or []:
+        token = entry.get("smsCode") or entry.get("smsText")
+        if isinstance(token, list):
+            token = token[-1] if token else None
+        if token:
+            results[str(entry.get("activationId"))] = (str(token), entry)
+    return results
+
+
+def _bulk_json_map(resp) -> dict:
+    """{"<order id>": {"otp"|"sms"|"code": ..} | "STATUS_OK:<code>"}"""
+    results = {}
+    for order_id, entry in (resp.json() or {}).items():
+        if isinstance(entry, dict):
+            token = entry.get("otp") or entry.get("sms") or entry.get("code")
+            raw = entry
+        else:
+            text = str(entry).strip()
+            parts = text.split(":")
+            token = parts[1] if text.startswith("STATUS_OK") and len(parts) > 1 else None
+            raw = {"text": text}
+        if token:
+            results[str(order_id)] = (str(token), raw)
+    return results
+
+
+PARSERS = {
+    "Text": (_number_text, _status_text, _cancel_text),
+    "JSON": (_number_json, _status_json, _cancel_json),
+}
+BULK_PARSERS = {"sms_activate": _bulk_sms_activate, "json_map": _bulk_json_map}
+
+
+class _Template:
+    """A URL template parsed once; placeholders are {id} and {service_code}."""
+
+    __slots__ = ("parts",)
+
+    def __init__(self, url: str):
+        self.parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(url)]
+
+    def __call__(self, **values) -> str:
+        return "".join(literal if field is None else literal + str(values[field])
+                       for literal, field in self.parts)
+
+
+def _template(url):
+    return _Template(url) if url else None
+
+
+def _headers(api) -> dict:
+    """ConnectApi.headers entries ({"key", "value"} or "Key: Value") as a dict."""
+    if not api.use_headers:
+        return {}
+    out = {}
+    for h in api.headers or []:
+        if isinstance(h, dict):
+            key, value = h.get("key"), h.get("value")
+        else:
+            key, _, value = str(h).partition(":")
+        if key and key.strip():
+            out[key.strip()] = (value or "").strip()
+    return out
+
+
+class GenericProvider(Provider):
+    """
+    SMS-activate style (Text: ACCESS_NUMBER / STATUS_OK / ACCESS_CANCEL) or
+    JSON provider, configured by URL templates from a ConnectApi.
+    """
+
+    def __init__(self, api_id=None, *, number_url=None, status_url=None, cancel_url=None,
+                 next_url=None, bulk_url=None, response_type="Text",
+                 bulk_parser="sms_activate", headers=None, api=None):
+        super().__init__(api_id, headers)
+        self.api = api
+        self._number_url = _template(number_url)
+        self._status_url = _template(status_url)
+        self._cancel_url = _template(cancel_url)
+        self._next_url = _template(next_url)
+        self._bulk_url = bulk_url or None
+        self._parse_number, self._parse_status, self._parse_cancel = \
+            PARSERS.get(response_type, PARSERS["Text"])
+        self._parse_bulk = BULK_PARSERS.get(bulk_parser, _bulk_sms_activate)
+        self.supports_bulk = bool(self._bulk_url)
+
+    @classmethod
+    def from_api(cls, api):
+        return cls(
+            api.id,
+            number_url=api.get_number_url,
+            status_url=api.get_status_url,
+            cancel_url=api.cancel_url,
+            next_url=api.next_number_url,
+            bulk_url=api.bulk_status_url,
+            response_type=api.response_type,
+            bulk_parser=api.bulk_status_parser,
+            headers=_headers(api),
+            api=api,
+        )
+
+    @classmethod
+    def from_pending(cls, otp):
+        """Built from the URLs copied onto an OtpPending (its ConnectApi is gone)."""
+        return cls(
+            otp.api_id,
+            status_url=otp.url,
+            cancel_url=otp.cancel_url,
+            next_url=otp.next_otp_url,
+            response_type=otp.responseType,
+        )
+
+    def get_number(self, service_code, timeout=10):
+        # Success for telemetry means a number was actually handed out
+        start = time.monotonic()
+        try:
+            resp = self._get(self._number_url(service_code=service_code), timeout=timeout)
+            result = self._parse_number(resp)
+        except Exception:
+            telemetry.record(self.api_id, "get_number", False, time.monotonic() - start)
+            raise
+        telemetry.record(self.api_id, "get_number", result is not None, time.monotonic() - start)
+        return result
+
+    def get_status(self, order_id):
+        return self._parse_status(self._get(self._status_url(id=order_id), op="status"))
+
+    def cancel(self, order_id):
+        if not self._cancel_url:
+            return True
+        start = time.monotonic()
+        try:
+            ok = self._parse_cancel(self._get(self._cancel_url(id=order_id)))
+        except Exception:
+            telemetry.record(self.api_id, "cancel", False, time.monotonic() - start)
+            raise
+        telemetry.record(self.api_id, "cancel", ok, time.monotonic() - start)
+        return ok
+
+    def next_sms(self, order_id):
+        if not self._next_url:
+            return False
+        self._get(self._next_url(id=order_id), op="next_sms")
+        return True
+
+    def bulk_status(self):
+        if not self._bulk_url:
+            raise NotImplementedError("no bulk status URL configured")
+        return self._parse_bulk(self._get(self._bulk_url, op="bulk_status"))
@@ -4,7 +4,7 @@ from mongoengine import Q
 from models.promo import PromoCode, PromoRedemption
 from models.transaction import Transaction
 from models.user import User
-from models.admin import Admin
+from bot.libs.notify import notify_admins
 
 LUCKY_TABLE = [
     # (weight, type, value) type: 'credit', 'percent', 'flat'
@@ -17,11 +17,7 @@ LUCKY_TABLE = [
 ]
 
 def _notify_admins(bot, text):
-    for adm in Admin.objects():
-        try:
-            bot.send_message(adm.telegram_id, text)
-        except Exception:
-            pass
+    notify_admins(text)
 
 def _now():
     return datetime.datetime.utcnow()
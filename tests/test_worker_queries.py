@@ -0,0 +1,110 @@
+"""
+Pins how many MongoDB commands one OTP worker poll tick issues, so the batch
+loader (utils.worker._load_jobs) cannot slide back into per-job lookups.
+
+Needs a scratch MongoDB (TEST_MONGO_URI; its database is dropped) and Redis
+(REDIS_URL; the otp:* schedule keys are deleted). Skipped when either is missing.
+
+    TEST_MONGO_URI=mongodb://localhost:27017/otp_worker_test python -m pytest -q tests
+"""
+import os
+import time
+
+import pytest
+from pymongo import monitoring
+
+MONGO_URI = os.getenv("TEST_MONGO_URI")
+BATCH_SIZES = (3, 30)
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo"}
+
+
+class _CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self.commands.append((event.command_name, event.command.get(event.command_name)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@pytest.fixture(scope="module")
+def env():
+    if not MONGO_URI:
+        pytest.skip("TEST_MONGO_URI not set")
+    from mongoengine import connect, disconnect
+    from utils.redis_client import redis_client
+    try:
+        redis_client.ping()
+    except Exception:
+        pytest.skip("Redis not reachable at REDIS_URL")
+
+    from benchmarks.fake_http import serve
+    from utils import worker
+
+    counter = _CommandCounter()
+    disconnect()
+    client = connect(host=MONGO_URI, event_listeners=[counter])
+    provider = serve(lambda path: (200, "STATUS_WAIT_CODE"))
+    yield worker, counter, redis_client, provider
+    provider.shutdown()
+    client.drop_database(client.get_default_database().name)
+    disconnect()
+
+
+def _seed(worker, redis_client, provider, n: int):
+    """One user with `n` pending orders, all due for a poll now."""
+    from models.order import Order
+    from models.otpPending import OtpPending
+    from models.user import User
+
+    for doc in (OtpPending, Order, User):
+        doc.drop_collection()
+    for key in (worker.POLL_KEY, worker.DEADLINE_KEY, worker.WAKE_KEY):
+        redis_client.delete(key, worker._fence_key(key))
+
+    user_id = User._get_collection().insert_one({"telegram_id": "1", "balance": 0.0}).inserted_id
+    status_url = f"http://127.0.0.1:{provider.server_port}/status?id={{id}}"
+    for i in range(n):
+        order_id = Order._get_collection().insert_one({
+            "user": user_id, "provider_order_id": str(i), "status": "pending",
+            "price": 1.0, "number": str(i),
+        }).inserted_id
+        otp = OtpPending(user=user_id, order=order_id, order_id=str(i), phone=str(i),
+                         url=status_url, chat_id=1, responseType="Text").save()
+        worker.schedule_otp(otp, poll_at=time.time() - 1)
+
+
+def _wait_for_polls(worker, timeout: float = 10):
+    """Ticks only queue the polls on the host pools; wait until they all ran."""
+    deadline = time.time() + timeout
+    while worker._in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    assert not worker._in_flight
+
+
+def test_poll_tick_query_count_does_not_grow_with_batch(env):
+    worker, counter, redis_client, provider = env
+    per_batch = {}
+    for n in BATCH_SIZES:
+        _seed(worker, redis_client, provider, n)
+        counter.commands.clear()
+        started = time.time()
+        worker._tick(started)
+        _wait_for_polls(worker)
+        per_batch[n] = list(counter.commands)
+
+        # Every job was polled and handed back to the schedule
+        assert redis_client.zcard(worker.POLL_KEY) == n
+        assert not worker._leases
+        assert not redis_client.zrangebyscore(worker.POLL_KEY, started + worker.LEASE_TTL, "+inf")
+
+    # One projected $in find per collection: jobs, orders, users
+    expected = [("find", "otp_pending"), ("find", "orders"), ("find", "user")]
+    for n, commands in per_batch.items():
+        assert commands == expected, f"batch of {n}: {commands}"
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import time
+
+from utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# Per-API circuit breaker (state shared by every process through Redis)
+# ===========================
+# closed    -> calls go through; outcomes are counted in BUCKET_SECONDS buckets
+# open      -> failed or slow calls over the last WINDOW_SECONDS crossed
+#              ERROR_RATE; calls are refused for OPEN_SECONDS
+# half_open -> one probe call at a time is let through; success closes the
+#              breaker, failure opens it again
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+WINDOW_SECONDS = 60
+BUCKET_SECONDS = 10
+MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "3"))
+OPEN_SECONDS = int(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+PROBE_TIMEOUT = 15        # a probe that never reports back is retried after this
+TRANSITIONS_KEPT = 20
+
+# Compare-and-set of the state, so concurrent processes log each transition once
+_transition_script = redis_client.register_script("""
+local current = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', ARGV[2], 'since', ARGV[3])
+redis.call('LPUSH', KEYS[2], ARGV[4])
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[5]) - 1)
+return 1
+""")
+
+
+def _key(api_id, part: str = "") -> str:
+    return f"breaker:{api_id}" + (f":{part}" if part else "")
+
+
+def _buckets(now: float) -> list:
+    last = int(now // BUCKET_SECONDS)
+    return [last - i for i in range(WINDOW_SECONDS // BUCKET_SECONDS)]
+
+
+def _window(api_id, now: float):
+    """(calls, failures) over the rolling window."""
+    pipe = redis_client.pipeline(transaction=False)
+    for b in _buckets(now):
+        pipe.hmget(_key(api_id, f"w:{b}"), "calls", "failures")
+    calls = failures = 0
+    for c, f in pipe.execute():
+        calls += int(c or 0)
+        failures += int(f or 0)
+    return calls, failures
+
+
+def _state(api_id) -> dict:
+    raw = redis_client.hgetall(_key(api_id))
+    raw = {k.decode(): v.decode() for k, v in raw.items()}
+    return {"state": raw.get("state", CLOSED), "since": float(raw["since"]) if raw.get("since") else None}
+
+
+def _transition(api_id, old: str, new: str, reason: str) -> bool:
+    now = time.time()
+    entry = json.dumps({"at": now, "from": old, "to": new, "reason": reason})
+    changed = bool(_transition_script(
+        keys=[_key(api_id), _key(api_id, "log")],
+        args=[old, new, now, entry, TRANSITIONS_KEPT],
+    ))
+    if changed:
+        logger.warning("Breaker %s: %s -> %s (%s)", api_id, old, new, reason)
+        if new == CLOSED:
+            # Start the closed state with a clean window
+            redis_client.delete(*[_key(api_id, f"w:{b}") for b in _buckets(now)])
+    return changed
+
+
+def allow(api_id) -> bool:
+    """May a call to this API go out now? Always True for unknown APIs."""
+    if not api_id:
+        return True
+    try:
+        st = _state(api_id)
+        if st["state"] == CLOSED:
+            return True
+        if st["state"] == OPEN:
+            if time.time() - (st["since"] or 0) < OPEN_SECONDS:
+                return False
+            _transition(api_id, OPEN, HALF_OPEN, f"{OPEN_SECONDS}s cool-down elapsed")
+        # half-open: one probe in flight at a time
+        return bool(redis_client.set(_key(api_id, "probe"), 1, nx=True, ex=PROBE_TIMEOUT))
+    except Exception as e:
+        logger.warning("Breaker check failed for %s: %s", api_id, e)
+        return True
+
+
+def record(api_id, ok: bool, latency: float):
+    """Count one call's outcome; slow calls count as failures."""
+    if not api_id:
+        return
+    failed = not ok or latency >= SLOW_CALL_SECONDS
+    now = time.time()
+    try:
+        bucket = _key(api_id, f"w:{int(now // BUCKET_SECONDS)}")
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hincrby(bucket, "calls", 1)
+        if failed:
+            pipe.hincrby(bucket, "failures", 1)
+        pipe.expire(bucket, WINDOW_SECONDS + BUCKET_SECONDS)
+        pipe.execute()
+
+        state = _state(api_id)["state"]
+        if state == HALF_OPEN:
+            redis_client.delete(_key(api_id, "probe"))
+            if failed:
+                _transition(api_id, HALF_OPEN, OPEN, "probe failed")
+            else:
+                _transition(api_id, HALF_OPEN, CLOSED, "probe succeeded")
+        elif state == CLOSED and failed:
+            calls, failures = _window(api_id, now)
+            if calls >= MIN_CALLS and failures / calls >= ERROR_RATE:
+                _transition(api_id, CLOSED, OPEN,
+                            f"{failures}/{calls} calls failed or slower than {SLOW_CALL_SECONDS:g}s")
+    except Exception as e:
+        logger.warning("Breaker record failed for %s: %s", api_id, e)
+
+
+def trip(api_id, reason: str):
+    """Open the breaker now, whatever the window says (e.g. the API is misconfigured)."""
+    if not api_id:
+        return
+    try:
+        state = _state(api_id)["state"]
+        if state != OPEN:
+            _transition(api_id, state, OPEN, reason)
+    except Exception as e:
+        logger.warning("Breaker trip failed for %s: %s", api_id, e)
+
+
+def status(api_id) -> dict:
+    """State, rolling error rate and recent transitions, for the admin panel."""
+    st = _state(api_id)
+    calls, failures = _window(api_id, time.time())
+    log = redis_client.lrange(_key(api_id, "log"), 0, TRANSITIONS_KEPT - 1)
+    return {
+        "state": st["state"],
+        "since": st["since"],
+        "calls": calls,
+        "failures": failures,
+        "error_rate": round(failures / calls, 2) if calls else None,
+        "transitions": [json.loads(t) for t in log],
+    }
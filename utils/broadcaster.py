@@ -0,0 +1,248 @@
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from models.broadcast import Broadcast
+from models.user import User
+from bot.sender import send_now
+from utils.redis_client import redis_client
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# Broadcast engine
+# ===========================
+# Jobs live in MongoDB; any process running start_broadcaster() can pick
+# them up. A per-job Redis lease makes sure only one worker runs a job,
+# and an expired lease (crashed worker) lets another one resume it.
+BATCH_SIZE = 200
+SEND_THREADS = 8            # enough in-flight requests to reach the global rate
+LEASE_TTL = 60
+IDLE_SLEEP = 5
+STATUS_EVERY = 5            # seconds between progress message edits
+SENT_TTL = 7 * 24 * 3600
+
+LEASE_KEY = "broadcast_lease:{id}"
+SENT_KEY = "broadcast:{id}:sent"
+
+bot_instance = None
+_threads = []
+_wakeup = threading.Event()
+_start_lock = threading.Lock()
+_backfilled = False
+
+
+def audience(include_unreachable: bool = False):
+    """
+    Users a broadcast goes to; unreachable chats are skipped by default.
+    Equality on both flags lets the (blocked, reachable, _id) index serve the
+    cursor range and the _id sort.
+    """
+    if include_unreachable:
+        return User.objects(blocked=False, reachable__in=[True, False])
+    return User.objects(blocked=False, reachable=True)
+
+
+def _backfill_audience_fields():
+    """Users saved before `blocked` / `reachable` existed lack them; give them the defaults."""
+    global _backfilled
+    if _backfilled:
+        return
+    User.objects(blocked__exists=False).update(set__blocked=False)
+    User.objects(reachable__exists=False).update(set__reachable=True)
+    _backfilled = True
+
+
+def _target_users(job: Broadcast):
+    query = audience(job.include_unreachable)
+    if job.cursor:
+        query = query.filter(id__gt=job.cursor)
+    return query.order_by("id").only("id", "telegram_id").limit(BATCH_SIZE).as_pymongo()
+
+
+def status_markup(job: Broadcast):
+    kb = InlineKeyboardMarkup()
+    if job.status in ("pending", "running"):
+        kb.row(
+            InlineKeyboardButton("⏸ Pause", callback_data=f"bcast:pause:{job.id}"),
+            InlineKeyboardButton("🛑 Cancel", callback_data=f"bcast:cancel:{job.id}"),
+        )
+    elif job.status == "paused":
+        kb.row(
+            InlineKeyboardButton("▶️ Resume", callback_data=f"bcast:resume:{job.id}"),
+            InlineKeyboardButton("🛑 Cancel", callback_data=f"bcast:cancel:{job.id}"),
+        )
+    return kb
+
+
+def status_text(job: Broadcast) -> str:
+    done = job.sent_count + job.failed_count
+    percent = int(done * 100 / job.total) if job.total else 100
+    labels = {
+        "pending": "⏳ Queued", "running": "📢 Running", "paused": "⏸ Paused",
+        "cancelled": "🛑 Cancelled", "done": "✅ Finished",
+    }
+    return (
+        f"{labels.get(job.status, job.status)} — broadcast <code>{job.id}</code>\n\n"
+        f"📊 Progress: {done}/{job.total} ({percent}%)\n"
+        f"📨 Sent: {job.sent_count}\n"
+        f"⚠️ Failed: {job.failed_count}"
+        f" (🚷 unreachable: {job.unreachable_count})"
+    )
+
+
+def update_status_message(bot, job: Broadcast):
+    if not job.chat_id or not job.status_message_id:
+        return
+    try:
+        bot.edit_message_text(status_text(job), chat_id=job.chat_id,
+                              message_id=job.status_message_id,
+                              reply_markup=status_markup(job))
+    except Exception:
+        pass  # "message is not modified" etc.
+
+
+def create_broadcast(bot, chat_id: int, admin_id: str, text: str,
+                     include_unreachable: bool = False) -> Broadcast:
+    """Store a new job, post its progress message and wake the workers."""
+    _backfill_audience_fields()
+    job = Broadcast(text=text, created_by=admin_id, chat_id=chat_id,
+                    include_unreachable=include_unreachable,
+                    total=audience(include_unreachable).count()).save()
+    msg = bot.send_message(chat_id, status_text(job), reply_markup=status_markup(job))
+    job.update(set__status_message_id=msg.message_id)
+    _wakeup.set()
+    return job
+
+
+def set_status(job_id: str, status: str):
+    """Pause / resume / cancel. Running workers notice at the next batch."""
+    allowed_from = {
+        "paused": ["pending", "running"],
+        "pending": ["paused"],
+        "cancelled": ["pending", "running", "paused"],
+    }
+    updated = Broadcast.objects(id=job_id, status__in=allowed_from[status]).update_one(
+        set__status=status, set__updated_at=datetime.datetime.utcnow())
+    if updated and status == "pending":
+        _wakeup.set()
+    return Broadcast.objects(id=job_id).first()
+
+
+# ===========================
+# Worker
+# ===========================
+def is_unreachable_error(e: Exception) -> bool:
+    """Blocked by the user, deactivated account or chat gone for good."""
+    if not isinstance(e, ApiTelegramException):
+        return False
+    description = (e.description or "").lower()
+    return e.error_code == 403 or (e.error_code == 400 and "chat not found" in description)
+
+
+def _send_one(job_id, telegram_id, text):
+    """Returns "sent", "failed", "unreachable", or None if skipped as a duplicate."""
+    # claim first: after a resume we would rather skip than send twice
+    if not redis_client.sadd(SENT_KEY.format(id=job_id), telegram_id):
+        return None
+    try:
+        send_now(bot_instance, "send_message", chat_id=telegram_id, text=text)
+        return "sent"
+    except Exception as e:
+        return "unreachable" if is_unreachable_error(e) else "failed"
+
+
+def _run_job(job: Broadcast, pool: ThreadPoolExecutor):
+    lease = LEASE_KEY.format(id=job.id)
+    sent_key = SENT_KEY.format(id=job.id)
+    if job.status == "pending":
+        # conditional: a pause/cancel that landed since the claim must win
+        Broadcast.objects(id=job.id, status="pending").update_one(
+            set__status="running", set__updated_at=datetime.datetime.utcnow())
+        job.reload()
+    last_status = 0.0
+
+    while True:
+        job.reload()
+        if job.status != "running":
+            break
+
+        users = list(_target_users(job))
+        if not users:
+            Broadcast.objects(id=job.id, status="running").update_one(
+                set__status="done", set__finished_at=datetime.datetime.utcnow(),
+                set__updated_at=datetime.datetime.utcnow())
+            redis_client.delete(sent_key)
+            break
+
+        results = list(pool.map(
+            lambda u: _send_one(job.id, u["telegram_id"], job.text), users))
+        sent = results.count("sent")
+        unreachable = [u["_id"] for u, r in zip(users, results) if r == "unreachable"]
+        failed = results.count("failed") + len(unreachable)
+        metrics.incr("broadcast_sent", sent)
+        metrics.incr("broadcast_failed", failed)
+
+        # one bulk write per batch for dead chats
+        if unreachable:
+            User.objects(id__in=unreachable).update(
+                set__reachable=False, set__last_failed_at=datetime.datetime.utcnow())
+            metrics.incr("broadcast_unreachable", len(unreachable))
+
+        Broadcast.objects(id=job.id).update_one(
+            set__cursor=users[-1]["_id"], inc__sent_count=sent, inc__failed_count=failed,
+            inc__unreachable_count=len(unreachable), set__updated_at=datetime.datetime.utcnow())
+        redis_client.expire(sent_key, SENT_TTL)
+        redis_client.expire(lease, LEASE_TTL)
+
+        if time.monotonic() - last_status >= STATUS_EVERY:
+            job.reload()
+            update_status_message(bot_instance, job)
+            last_status = time.monotonic()
+
+    job.reload()
+    update_status_message(bot_instance, job)
+
+
+def _claim_job():
+    for job in Broadcast.objects(status__in=["pending", "running"]).order_by("created_at"):
+        if redis_client.set(LEASE_KEY.format(id=job.id), "1", ex=LEASE_TTL, nx=True):
+            return job
+    return None
+
+
+def _worker_loop():
+    pool = ThreadPoolExecutor(max_workers=SEND_THREADS)
+    while True:
+        try:
+            job = _claim_job()
+            if job is None:
+                _wakeup.wait(IDLE_SLEEP)
+                _wakeup.clear()
+                continue
+            try:
+                _run_job(job, pool)
+            finally:
+                redis_client.delete(LEASE_KEY.format(id=job.id))
+        except Exception as e:
+            logger.exception("Broadcast worker error: %s", e)
+            time.sleep(IDLE_SLEEP)
+
+
+def start_broadcaster(bot, workers: int = 1):
+    """Start broadcast worker threads in this process (also resumes crashed jobs)."""
+    global bot_instance
+    with _start_lock:
+        bot_instance = bot
+        alive = [t for t in _threads if t.is_alive()]
+        for _ in range(max(0, workers - len(alive))):
+            t = threading.Thread(target=_worker_loop, daemon=True)
+            t.start()
+            alive.append(t)
+        _threads[:] = alive
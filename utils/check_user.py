@@ -2,9 +2,11 @@ from utils.config import get_required_links
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from telebot import apihelper
 import logging
+import threading
 import redis
 import json
 import time
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -33,25 +35,92 @@ def join_check_keyboard(group_link: str = None, channel_link: str = None) -> Inl
     return kb
 
 
+def _cache_key(user_id, chat_id) -> str:
+    return f"membership:{user_id}:{chat_id}"
+
+
 def cache_get_status(user_id: str, chat_id: str):
     """Retrieve membership status from Redis cache."""
-    key = f"membership:{user_id}:{chat_id}"
-    data = r.get(key)
+    data = r.get(_cache_key(user_id, chat_id))
     if data:
         return json.loads(data).get("status")
     return None
 
 
+def cache_get_statuses(user_id: str, chat_ids: list) -> list:
+    """Retrieve statuses for several chats in one MGET (None = not cached)."""
+    if not chat_ids:
+        return []
+    rows = r.mget([_cache_key(user_id, cid) for cid in chat_ids])
+    return [json.loads(row).get("status") if row else None for row in rows]
+
+
 def cache_set_status(user_id: str, chat_id: str, status: str, ttl: int = 300):
     """Store membership status in Redis with TTL."""
-    key = f"membership:{user_id}:{chat_id}"
-    r.setex(key, ttl, json.dumps({"status": status, "ts": int(time.time())}))
+    r.setex(_cache_key(user_id, chat_id), ttl, json.dumps({"status": status, "ts": int(time.time())}))
+
+
+# ===========================
+# Single-flight Telegram lookups
+# ===========================
+# Concurrent misses for the same (user, chat) share one get_chat_member call.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _fetch_status(bot, user_id: str, target_id: str) -> str:
+    key = (user_id, target_id)
+    with _inflight_lock:
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = threading.Event()
+
+    if not leader:
+        event.wait(timeout=10)
+        status = cache_get_status(user_id, target_id)
+        if status is not None:
+            metrics.incr("membership_coalesced")
+            return status
+
+    try:
+        with metrics.timer("membership_api_seconds"):
+            status = bot.get_chat_member(target_id, user_id).status
+        metrics.incr("membership_api_calls")
+        cache_set_status(user_id, target_id, status)
+        return status
+    finally:
+        if leader:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            event.set()
+
+
+def warm_membership(chat_member: dict):
+    """
+    Keep the cache warm from `chat_member` updates (the bot must be admin in
+    the required chats and `chat_member` must be in the webhook's allowed_updates).
+    """
+    chat = chat_member.get("chat", {})
+    new = chat_member.get("new_chat_member", {})
+    user_id = str(new.get("user", {}).get("id", ""))
+    status = new.get("status")
+    if not user_id or not status:
+        return
+
+    # required chats may be configured by numeric id or by @username
+    targets = [str(chat.get("id"))]
+    if chat.get("username"):
+        targets.append(f"@{chat['username']}")
+    for target_id in targets:
+        cache_set_status(user_id, target_id, status)
+    metrics.incr("membership_warmed")
 
 
 def ensure_membership(bot, chat_id: int, user_id: str) -> bool:
     """
     Ensure user is a member of required group/channel.
-    Cached in Redis for 300s.
+    Cached in Redis for 300s; all required chats are read with one MGET.
     """
     links = get_required_links()
     group_id = links.get("group_id")
@@ -61,16 +130,17 @@ def ensure_membership(bot, chat_id: int, user_id: str) -> bool:
 
     required_chats = [(group_id, group_link), (channel_id, channel_link)]
     required_chats = [(cid, link) for cid, link in required_chats if cid]
+    target_id = None
 
     try:
-        for target_id, invite_link in required_chats:
-            # Check Redis first
-            status = cache_get_status(user_id, target_id)
-
+        cached = cache_get_statuses(user_id, [cid for cid, _ in required_chats])
+        # One hit/miss per check, not per chat (counters are buffered in-process)
+        if required_chats:
+            metrics.incr("membership_cache_miss" if None in cached else "membership_cache_hit")
+        for (target_id, invite_link), status in zip(required_chats, cached):
             if status is None:
                 # Call Telegram API if not cached
-                status = bot.get_chat_member(target_id, user_id).status
-                cache_set_status(user_id, target_id, status)
+                status = _fetch_status(bot, user_id, target_id)
 
             if status in {"left", "kicked"}:
                 bot.send_message(
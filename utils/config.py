@@ -1,8 +1,64 @@
+import threading
+import time
+
 from models.config import Config
+from models.payment_config import PaymentConfig
+from utils import events
+
+# ===========================
+# Settings cache
+# ===========================
+# All Config keys and the PaymentConfig document are loaded together and
+# served from memory; writes through this module invalidate the cache
+# in every process.
+SETTINGS_TTL = 60
+
+# `generation` is bumped by every invalidation; a load that overlapped one
+# keeps its data but stays stale, so the next read loads again.
+_settings = {"loaded_at": None, "generation": 0, "config": {}, "payment": None}
+_settings_lock = threading.Lock()
+_subscribed = False
+
+
+def _is_stale():
+    loaded_at = _settings["loaded_at"]
+    return loaded_at is None or time.monotonic() - loaded_at > SETTINGS_TTL
+
+
+def _load_settings():
+    global _subscribed
+    if not _subscribed:
+        # other processes' writes invalidate us through utils.events
+        events.subscribe("settings_changed", _on_settings_changed)
+        _subscribed = True
+    generation = _settings["generation"]
+    config = {c.key: c.value for c in Config.objects().only("key", "value")}
+    payment = PaymentConfig.objects().first()
+    fresh = _settings["generation"] == generation
+    _settings.update(loaded_at=time.monotonic() if fresh else None, config=config, payment=payment)
+
+
+def _current_settings():
+    if _is_stale():
+        with _settings_lock:
+            if _is_stale():
+                _load_settings()
+    return _settings
+
+
+def _on_settings_changed():
+    _settings["generation"] += 1
+    _settings["loaded_at"] = None
+
+
+def invalidate_settings():
+    """Force the next read to reload Config and PaymentConfig, in every process."""
+    _on_settings_changed()
+    events.publish("settings_changed")
+
 
 def get_config(key: str, default=None):
-    cfg = Config.objects(key=key).first()
-    return cfg.value if cfg else default
+    return _current_settings()["config"].get(key, default)
 
 def set_config(key: str, value: str):
     cfg = Config.objects(key=key).first()
@@ -10,17 +66,24 @@ def set_config(key: str, value: str):
         cfg.update(value=value)
     else:
         Config(key=key, value=value).save()
+    invalidate_settings()
+
+
+def get_payment_config():
+    """Cached PaymentConfig document (read-only; admin writes go through the model)."""
+    return _current_settings()["payment"]
 
 
 def get_required_links():
     """
     Return both IDs and invite links for group & channel.
     """
+    config = _current_settings()["config"]
     return {
-        "group_id": get_config("required_group_id", ""),
-        "group_link": get_config("required_group_link", ""),
-        "channel_id": get_config("required_channel_id", ""),
-        "channel_link": get_config("required_channel_link", "")
+        "group_id": config.get("required_group_id") or "",
+        "group_link": config.get("required_group_link") or "",
+        "channel_id": config.get("required_channel_id") or "",
+        "channel_link": config.get("required_channel_link") or ""
     }
 
 
@@ -0,0 +1,71 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# Cross-process invalidation bus (Redis pub/sub)
+# ===========================
+CHANNEL = "bot:events"
+
+# Delivered locally each time the listener (re)subscribes: anything published
+# while it was disconnected was missed, so caches fed by events should reload.
+RESUBSCRIBED = "events_resubscribed"
+
+_listeners = defaultdict(list)
+_listener_thread = None
+_listener_lock = threading.Lock()
+
+
+def publish(topic: str, **payload):
+    """
+    Notify every process (this one included, immediately) that `topic` changed.
+    Listeners must be idempotent: the local process also gets the Redis echo.
+    """
+    _deliver(topic, payload)
+    try:
+        redis_client.publish(CHANNEL, json.dumps({"topic": topic, "payload": payload}))
+    except Exception as e:
+        logger.warning("Failed to publish %s: %s", topic, e)
+
+
+def subscribe(topic: str, callback):
+    """Call `callback(**payload)` whenever `topic` is published anywhere."""
+    _listeners[topic].append(callback)
+    _ensure_listener()
+
+
+def _deliver(topic, payload):
+    for callback in list(_listeners.get(topic, [])):
+        try:
+            callback(**payload)
+        except Exception as e:
+            logger.exception("Event listener for %s failed: %s", topic, e)
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            _deliver(RESUBSCRIBED, {})
+            for message in pubsub.listen():
+                data = json.loads(message["data"])
+                _deliver(data.get("topic"), data.get("payload") or {})
+        except Exception as e:
+            logger.warning("Event listener disconnected: %s", e)
+            time.sleep(1)
+
+
+def _ensure_listener():
+    global _listener_thread
+    with _listener_lock:
+        if _listener_thread and _listener_thread.is_alive():
+            return
+        _listener_thread = threading.Thread(target=_listen, daemon=True)
+        _listener_thread.start()
@@ -0,0 +1,116 @@
+import atexit
+import os
+import threading
+import time
+from collections import defaultdict
+
+from utils.redis_client import redis_client
+
+METRICS_KEY = "metrics"
+
+# incr()/observe() only update an in-process buffer; a background thread
+# folds it into the shared METRICS_KEY hash every FLUSH_INTERVAL seconds.
+FLUSH_INTERVAL = 1
+
+# ARGV = field1, value1, ... ; keeps the larger of the stored and given value
+_max_script = redis_client.register_script("""
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current or tonumber(ARGV[i + 1]) > tonumber(current) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+""")
+
+_counts = defaultdict(int)
+_sums = defaultdict(float)
+_maxes = {}
+_buffer_lock = threading.Lock()
+_flusher_pid = None
+
+
+def incr(name: str, amount: int = 1):
+    """Increment a counter shared by every process."""
+    _ensure_flusher()
+    with _buffer_lock:
+        _counts[name] += amount
+
+
+def observe(name: str, value: float):
+    """Record one sample of a timing/size metric as count + sum + max."""
+    _ensure_flusher()
+    with _buffer_lock:
+        _counts[f"{name}:count"] += 1
+        _sums[f"{name}:sum"] += value
+        if value > _maxes.get(f"{name}:max", float("-inf")):
+            _maxes[f"{name}:max"] = value
+
+
+def flush():
+    """Push the buffered counters to Redis."""
+    global _counts, _sums, _maxes
+    with _buffer_lock:
+        counts, sums, maxes = _counts, _sums, _maxes
+        _counts, _sums, _maxes = defaultdict(int), defaultdict(float), {}
+    if not (counts or sums or maxes):
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for field, amount in counts.items():
+            pipe.hincrby(METRICS_KEY, field, amount)
+        for field, amount in sums.items():
+            pipe.hincrbyfloat(METRICS_KEY, field, amount)
+        pipe.execute()
+        if maxes:
+            _max_script(keys=[METRICS_KEY], args=[x for kv in maxes.items() for x in kv])
+    except Exception:
+        pass
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _ensure_flusher():
+    # Keyed on the pid: a forked child (consumer shards) needs its own thread
+    global _flusher_pid, _counts, _sums, _maxes
+    if _flusher_pid == os.getpid():
+        return
+    with _buffer_lock:
+        if _flusher_pid == os.getpid():
+            return
+        if _flusher_pid is not None:
+            # Inherited from the parent, which flushes it itself
+            _counts, _sums, _maxes = defaultdict(int), defaultdict(float), {}
+        else:
+            atexit.register(flush)
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, daemon=True).start()
+
+
+class timer:
+    """Context manager: `with timer("name"): ...` observes elapsed seconds."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.monotonic() - self.start)
+        return False
+
+
+def snapshot() -> dict:
+    """Return all counters as {name: number}."""
+    raw = redis_client.hgetall(METRICS_KEY)
+    out = {}
+    for k, v in raw.items():
+        k = k.decode() if isinstance(k, bytes) else k
+        out[k] = float(v)
+    return out
@@ -0,0 +1,9 @@
+import os
+import redis
+
+# ===========================
+# Shared Redis connection
+# ===========================
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+redis_client = redis.Redis.from_url(REDIS_URL)
@@ -0,0 +1,108 @@
+import threading
+import time
+
+from models.admin import Admin
+from models.user import User
+from utils import events
+
+# ===========================
+# In-process banned / admin registries
+# ===========================
+# Loaded per process and kept current through utils.events, so the
+# dispatcher's hot-path gate and is_admin() never touch MongoDB. Events sent
+# while the listener was reconnecting are lost, so both sets are reloaded
+# after every (re)subscribe and at least every REGISTRY_TTL seconds.
+REGISTRY_TTL = 60
+
+_banned = set()
+_admins = set()
+_admin_settings = {}
+_loaded_at = None
+_subscribed = False
+_load_lock = threading.RLock()
+
+
+def load_registries():
+    """(Re)load both sets from MongoDB and subscribe to changes."""
+    global _banned, _loaded_at, _subscribed
+    with _load_lock:
+        if not _subscribed:
+            events.subscribe("user_ban", _on_user_ban)
+            events.subscribe("admins_changed", _on_admins_changed)
+            events.subscribe(events.RESUBSCRIBED, _on_resubscribed)
+            _subscribed = True
+        _banned = set(User.objects(blocked=True).distinct("telegram_id"))
+        _load_admins()
+        _loaded_at = time.monotonic()
+
+
+def _is_stale():
+    return _loaded_at is None or time.monotonic() - _loaded_at > REGISTRY_TTL
+
+
+def _ensure_loaded():
+    if _is_stale():
+        with _load_lock:
+            if _is_stale():
+                load_registries()
+
+
+def _on_resubscribed():
+    # Reload on the next read rather than in the listener thread
+    global _loaded_at
+    _loaded_at = None
+
+
+def _on_user_ban(telegram_id: str, banned: bool):
+    if banned:
+        _banned.add(str(telegram_id))
+    else:
+        _banned.discard(str(telegram_id))
+
+
+def _load_admins():
+    global _admins, _admin_settings
+    settings = {}
+    for a in Admin.objects.only("telegram_id", "digest_interval", "digest_max_events", "urgent_events"):
+        settings[a.telegram_id] = {
+            "digest_interval": a.digest_interval or 0,
+            "digest_max_events": a.digest_max_events or 0,
+            "urgent_events": set(a.urgent_events or []),
+        }
+    _admin_settings = settings
+    _admins = set(settings)
+
+
+def _on_admins_changed():
+    _load_admins()
+
+
+def is_banned(telegram_id: str) -> bool:
+    _ensure_loaded()
+    return str(telegram_id) in _banned
+
+
+def is_admin_id(telegram_id: str) -> bool:
+    _ensure_loaded()
+    return str(telegram_id) in _admins
+
+
+def admin_ids() -> list:
+    _ensure_loaded()
+    return list(_admins)
+
+
+def admin_settings(telegram_id: str) -> dict:
+    """Digest settings for one admin (empty dict if unknown)."""
+    _ensure_loaded()
+    return _admin_settings.get(str(telegram_id), {})
+
+
+def set_banned(telegram_id: str, banned: bool):
+    """Call after saving User.blocked so every process updates its set."""
+    events.publish("user_ban", telegram_id=str(telegram_id), banned=bool(banned))
+
+
+def admins_changed():
+    """Call after any write to the Admin collection."""
+    events.publish("admins_changed")
@@ -0,0 +1,175 @@
+import atexit
+import datetime
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from bot import sender
+from models.provider_stat import ProviderStat
+from utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# Provider call telemetry
+# ===========================
+# record() only updates an in-process buffer. A background thread flushes it
+# every FLUSH_INTERVAL into per-minute Redis hashes
+# ("tel:<api_id>:<op>:<minute>"), and the sender leader rolls closed minutes
+# up into hourly ProviderStat documents.
+OPS = ("get_number", "status", "bulk_status", "next_sms", "cancel", "first_otp")
+
+BUCKET_SECONDS = 60
+RETENTION = 2 * 3600              # raw minute buckets kept this long in Redis
+FLUSH_INTERVAL = 5
+ROLLUP_EVERY = 60
+PENDING_KEY = "tel:pending"       # minute buckets not rolled up yet
+
+# Latency histogram upper bounds in ms (first_otp is measured in minutes)
+LATENCY_BOUNDS_MS = (250, 500, 1000, 2000, 5000, 10000, 30000, 60000, 120000, 300000, 600000)
+
+_buffer = {}
+_buffer_lock = threading.Lock()
+_flusher = None
+_last_rollup = 0.0
+
+
+def _hist_field(latency: float) -> str:
+    ms = latency * 1000
+    for bound in LATENCY_BOUNDS_MS:
+        if ms <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+def record(api_id, op: str, ok: bool, latency: float):
+    """Count one provider call. No I/O: safe on the hot path."""
+    if not api_id:
+        return
+    minute = int(time.time() // BUCKET_SECONDS) * BUCKET_SECONDS
+    with _buffer_lock:
+        row = _buffer.get((str(api_id), op, minute))
+        if row is None:
+            row = _buffer[(str(api_id), op, minute)] = defaultdict(float)
+        row["calls"] += 1
+        row["ok"] += 1 if ok else 0
+        row["latency_sum"] += latency
+        row[_hist_field(latency)] += 1
+    _ensure_flusher()
+
+
+def flush():
+    """Push the buffered counts to Redis."""
+    global _buffer
+    with _buffer_lock:
+        rows, _buffer = _buffer, {}
+    if not rows:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for (api_id, op, minute), row in rows.items():
+        key = f"tel:{api_id}:{op}:{minute}"
+        for field, value in row.items():
+            if field == "latency_sum":
+                pipe.hincrbyfloat(key, field, value)
+            else:
+                pipe.hincrby(key, field, int(value))
+        pipe.expire(key, RETENTION)
+        pipe.sadd(PENDING_KEY, key)
+    try:
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Telemetry flush failed, %d buckets dropped: %s", len(rows), e)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _buffer_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+def rollup():
+    """Fold closed minute buckets into hourly ProviderStat documents."""
+    global _last_rollup
+    if time.monotonic() - _last_rollup < ROLLUP_EVERY:
+        return
+    _last_rollup = time.monotonic()
+
+    # A minute is closed once every process has had time to flush into it
+    closed_before = time.time() - BUCKET_SECONDS - 2 * FLUSH_INTERVAL
+    for key in redis_client.smembers(PENDING_KEY):
+        key = key.decode() if isinstance(key, bytes) else key
+        _, api_id, op, minute = key.split(":")
+        if int(minute) > closed_before:
+            continue
+        # Read and drop the bucket in one MULTI: a late flush starts a new
+        # bucket (rolled up next time) instead of being counted twice
+        pipe = redis_client.pipeline()
+        pipe.hgetall(key)
+        pipe.delete(key)
+        pipe.srem(PENDING_KEY, key)
+        row = {k.decode(): v.decode() for k, v in pipe.execute()[0].items()}
+        if row:
+            hour = datetime.datetime.utcfromtimestamp(int(minute) // 3600 * 3600)
+            inc = {
+                "inc__calls": int(row.pop("calls", 0)),
+                "inc__ok": int(row.pop("ok", 0)),
+                "inc__latency_sum": float(row.pop("latency_sum", 0)),
+            }
+            inc.update({f"inc__latency_hist__{field}": int(v) for field, v in row.items()})
+            ProviderStat.objects(api_id=api_id, op=op, hour=hour).update_one(upsert=True, **inc)
+
+
+sender.register_periodic(rollup)
+
+
+def _p95(hist: dict, calls: int):
+    """Upper bound (seconds) of the histogram bucket holding the 95th percentile."""
+    seen = 0
+    for bound in LATENCY_BOUNDS_MS:
+        seen += hist.get(f"le_{bound}", 0)
+        if seen >= 0.95 * calls:
+            return bound / 1000
+    return None
+
+
+def summary(hours: int = 24, api_id=None) -> dict:
+    """{api_id: {op: {calls, ok, success_rate, avg_latency, p95_latency}}} over the last `hours`."""
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    query = ProviderStat.objects(hour__gte=since)
+    if api_id:
+        query = query.filter(api_id=str(api_id))
+
+    totals = {}
+    for stat in query:
+        t = totals.setdefault(stat.api_id, {}).setdefault(
+            stat.op, {"calls": 0, "ok": 0, "latency_sum": 0.0, "hist": defaultdict(int)})
+        t["calls"] += stat.calls
+        t["ok"] += stat.ok
+        t["latency_sum"] += stat.latency_sum
+        for field, n in (stat.latency_hist or {}).items():
+            t["hist"][field] += n
+
+    out = {}
+    for api, ops in totals.items():
+        for op, t in ops.items():
+            calls = t["calls"]
+            out.setdefault(api, {})[op] = {
+                "calls": calls,
+                "ok": t["ok"],
+                "success_rate": round(t["ok"] / calls, 3) if calls else None,
+                "avg_latency": round(t["latency_sum"] / calls, 3) if calls else None,
+                "p95_latency": _p95(t["hist"], calls) if calls else None,
+            }
+    return out
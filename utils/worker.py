@@ -1,276 +1,854 @@
+"""
+OTP worker: polls providers for pending orders and runs auto-cancel deadlines.
+
+Runs as its own long-lived process (the webhook only schedules jobs). Start
+as many as needed on any node; jobs are shared through fenced leases.
+
+Usage:
+    python -m utils.worker            # run until SIGTERM / Ctrl+C
+    python -m utils.worker --health   # print worker health, exit 1 if none alive
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
 import threading
 import time
-import requests
+import uuid
 import datetime
-import redis
+import calendar
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 from models.otpPending import OtpPending
 from models.otp import OtpMessage
 from models.order import Order
+from models.server import ConnectApi
 from models.transaction import Transaction
+from models.user import User
 from bot.libs.Admin_message import auto_cancel_text, recived_otp_text
-from models.admin import Admin
 from bot.libs.helpers import build_messages_block
+from bot import sender
+from bot.libs.notify import notify_admins
+from utils.redis_client import redis_client
+from utils import metrics
+from utils import breaker
+from utils import telemetry
+from providers import GenericProvider, get_provider
+from providers.base import HOST_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
 # ===========================
 # Redis Setup
 # ===========================
-redis_client = redis.Redis(host="127.0.0.1", port=6379, db=0)
-LOCK_KEY = "otp_worker_lock"
-LOCK_TTL = 30 
+# Due-time schedule: member = OtpPending id, score = unix time it is due.
+# Polls and auto-cancel deadlines are separate events.
+POLL_KEY = "otp:poll"
+DEADLINE_KEY = "otp:deadline"
+POLL_INTERVAL = 1        # seconds between two polls when the API is unknown
+CLAIM_BATCH = 100        # jobs claimed per tick
+MAX_IDLE_SLEEP = 1       # longest wait while jobs are scheduled
+IDLE_WAIT = 5            # longest wait with nothing scheduled (also bounds shutdown time)
+WAKE_KEY = "otp:wake"    # list pushed on every new job; idle workers block on it
+
+# Any number of worker processes share the schedule; see "Job leases"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+WORKERS_KEY = "otp:workers"   # zset: worker id -> last heartbeat
+HEALTH_KEY = "otp:health"     # hash: worker id -> JSON status
+LEASE_TTL = 10                # a claimed job reappears this long after its worker dies
+HEARTBEAT_INTERVAL = 3
+DEADLINE_RETRY = 30           # a failed auto-cancel is retried this much later
+ERROR_BACKOFF = 5             # pause after a failed tick (Redis / MongoDB down)
+
+# Per-job set of delivered OTP hashes, so duplicate checks skip MongoDB
+SEEN_KEY = "otp:seen:{}"
+SEEN_TTL_MARGIN = 3600   # kept this long past the job's cancelTime at most
+
+# Push intake: key spellings accepted in provider callbacks
+PUSH_ORDER_KEYS = ("order_id", "activationId", "activation_id", "id")
+PUSH_CODE_KEYS = ("otp", "code", "smsCode", "sms", "smsText", "text")
+
+# Concurrent polling: each provider host gets its own HOST_CONCURRENCY poll
+# threads, so a slow host only delays its own jobs. Ticks do not wait for the
+# requests; in-flight jobs keep their (heartbeated) leases until they finish.
+BREAKER_BACKOFF = 10       # poll delay while a provider's breaker is open
+
+_status = {"started_at": None, "last_tick": None, "ticks": 0, "errors": 0}
+
+FINISHED_STATUSES = ("cancelled", "refunded", "completed")
+
+
+# ===============
+# Job leases
+# ===============
+# Claiming a job leases it: its score moves LEASE_TTL ahead and its fencing
+# token (a per-job counter in "<key>:fence") is bumped. The owner heartbeats
+# its leases; every schedule write is conditional on the token, so a stalled
+# worker whose lease was taken over cannot clobber the new owner's state.
+# A dead worker's jobs simply come due again and any live worker picks them up.
+_claim_script = redis_client.register_script("""
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+local out = {}
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[1], ARGV[2], id)
+    out[#out + 1] = id
+    out[#out + 1] = redis.call('HINCRBY', KEYS[2], id, 1)
+end
+return out
+""")
+
+# ARGV = score, id1, token1, id2, token2, ... ; returns the ids whose lease was lost
+_fenced_zadd_script = redis_client.register_script("""
+local lost = {}
+for i = 2, #ARGV, 2 do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[i + 1] then
+        redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[i])
+    else
+        lost[#lost + 1] = ARGV[i]
+    end
+end
+return lost
+""")
+
+# Hand-back: ARGV = score, id, token. Bumps the fence as well, so a heartbeat
+# that read the lease before the release cannot push the job out again.
+_release_script = redis_client.register_script("""
+if redis.call('HGET', KEYS[2], ARGV[2]) ~= ARGV[3] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[2])
+redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+return 1
+""")
+
+_leases = {}   # (key, otp id) -> fencing token held by this process
+_in_flight = set()   # poll job ids queued or running on a host pool
+_leases_lock = threading.Lock()
+
+
+def _fence_key(key: str) -> str:
+    return f"{key}:fence"
+
+
+def _owns(key: str, otp_id) -> bool:
+    """True while this process still holds the lease on the job."""
+    with _leases_lock:
+        token = _leases.get((key, str(otp_id)))
+    if token is None:
+        return False
+    current = redis_client.hget(_fence_key(key), str(otp_id))
+    return current is not None and int(current) == token
+
+
+def _release(key: str, otp_id, due_at: float) -> bool:
+    """Hand the job back to the schedule, due at `due_at`, if we still own it."""
+    with _leases_lock:
+        token = _leases.pop((key, str(otp_id)), None)
+    if token is None:
+        return False
+    return bool(_release_script(keys=[key, _fence_key(key)], args=[due_at, str(otp_id), token]))
+
+
+def _heartbeat():
+    """Extend every lease this process holds and advertise the worker as alive."""
+    now = time.time()
+    with _leases_lock:
+        leases = len(_leases)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zadd(WORKERS_KEY, {WORKER_ID: now})
+    pipe.hset(HEALTH_KEY, WORKER_ID, json.dumps(dict(_status, heartbeat=now, leases=leases)))
+    pipe.execute()
+    redis_client.zremrangebyscore(WORKERS_KEY, "-inf", now - 10 * LEASE_TTL)
+    with _leases_lock:
+        held = list(_leases.items())
+    by_key = {}
+    for (key, otp_id), token in held:
+        by_key.setdefault(key, []).extend([otp_id, token])
+    for key, args in by_key.items():
+        lost = _fenced_zadd_script(keys=[key, _fence_key(key)], args=[now + LEASE_TTL] + args)
+        with _leases_lock:
+            for otp_id in lost:
+                _leases.pop((key, otp_id.decode() if isinstance(otp_id, bytes) else otp_id), None)
+
+
+def _heartbeat_loop(stop: threading.Event):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            _heartbeat()
+        except Exception as e:
+            logger.warning("Heartbeat failed: %s", e)
+
+
+def live_workers() -> list:
+    """Ids of worker processes that heartbeated within LEASE_TTL."""
+    ids = redis_client.zrangebyscore(WORKERS_KEY, time.time() - LEASE_TTL, "+inf")
+    return [i.decode() if isinstance(i, bytes) else i for i in ids]
+
+
+def health() -> dict:
+    """{worker id: status} for live workers, plus the schedule size."""
+    alive = live_workers()
+    statuses = redis_client.hmget(HEALTH_KEY, alive) if alive else []
+    return {
+        "workers": {w: json.loads(s) for w, s in zip(alive, statuses) if s},
+        "scheduled": redis_client.zcard(POLL_KEY),
+    }
+
+
+# ===============
+# Providers
+# ===============
+_host_pools = {}   # provider host -> ThreadPoolExecutor
+_host_pools_lock = threading.Lock()
+
+
+def _provider_for(otp):
+    """The job's cached provider, or one built from the URLs copied onto the job."""
+    return get_provider(otp.api_id) or GenericProvider.from_pending(otp)
+
+
+def _host_pool(host: str) -> ThreadPoolExecutor:
+    with _host_pools_lock:
+        pool = _host_pools.get(host)
+        if pool is None:
+            pool = _host_pools[host] = ThreadPoolExecutor(
+                max_workers=HOST_CONCURRENCY, thread_name_prefix=f"poll-{host}")
+    return pool
+
+
+def _shutdown_poll_pools():
+    """Let queued polls finish (worker shutdown)."""
+    with _host_pools_lock:
+        pools = list(_host_pools.values())
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+def _dispatch(url: str, otps, fn, *args):
+    """Queue `fn(*args)`, which polls `otps`, on the pool of the host `url` points to."""
+    ids = [str(otp.id) for otp in otps]
+    with _leases_lock:
+        _in_flight.update(ids)
+    future = _host_pool(urlparse(url or "").netloc).submit(fn, *args)
+    future.add_done_callback(lambda _: _landed(ids))
+    return future
+
 
-bot_instance = None
-otp_lock = threading.Lock()
-worker_thread = None
-DEBUG_ADMIN_ID = 1443989714
+def _landed(ids):
+    with _leases_lock:
+        _in_flight.difference_update(ids)
+        for otp_id in ids:
+            # Normally released by the job; a leftover lease lapses after LEASE_TTL
+            _leases.pop((POLL_KEY, otp_id), None)
 
 
 # ===============
-# Lock Functions
+# Scheduler
 # ===============
-def acquire_lock():
+def _epoch(dt: datetime.datetime) -> float:
+    return calendar.timegm(dt.utctimetuple())
+
+
+def schedule_otp(otp, poll_at: float = None, poll: bool = True):
+    """Add a pending OTP to the poll schedule (unless pushed) and its auto-cancel deadline."""
+    pipe = redis_client.pipeline(transaction=False)
+    if poll:
+        pipe.zadd(POLL_KEY, {str(otp.id): poll_at or time.time()})
+    if otp.cancelTime:
+        created = otp.created_at or datetime.datetime.utcnow()
+        pipe.zadd(DEADLINE_KEY, {str(otp.id): _epoch(created) + otp.cancelTime})
+    pipe.execute()
+
+
+def unschedule_otp(otp_id):
+    with _leases_lock:
+        _leases.pop((POLL_KEY, str(otp_id)), None)
+        _leases.pop((DEADLINE_KEY, str(otp_id)), None)
+    pipe = redis_client.pipeline(transaction=False)
+    for key in (POLL_KEY, DEADLINE_KEY):
+        pipe.zrem(key, str(otp_id))
+        pipe.hdel(_fence_key(key), str(otp_id))
+    pipe.delete(SEEN_KEY.format(otp_id))   # job finished: forget its codes
+    pipe.execute()
+
+
+def _stop_polling(otp_id):
+    """Drop a job from the poll schedule only; its deadline stays."""
+    with _leases_lock:
+        _leases.pop((POLL_KEY, str(otp_id)), None)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zrem(POLL_KEY, str(otp_id))
+    pipe.hdel(_fence_key(POLL_KEY), str(otp_id))
+    pipe.execute()
+
+
+def rebuild_schedule():
+    """Re-seed the schedule from MongoDB (worker start / after a Redis flush)."""
+    now = time.time()
+    pushed = {str(a.id) for a in ConnectApi.objects(push_enabled=True).only("id")}
+    pipe = redis_client.pipeline(transaction=False)
+    for otp in OtpPending.objects().only("id", "api_id", "created_at", "cancelTime"):
+        if otp.api_id not in pushed:
+            pipe.zadd(POLL_KEY, {str(otp.id): now}, nx=True)
+        if otp.cancelTime:
+            created = otp.created_at or datetime.datetime.utcnow()
+            pipe.zadd(DEADLINE_KEY, {str(otp.id): _epoch(created) + otp.cancelTime}, nx=True)
+    pipe.execute()
+
+
+def resume_polling(api_id):
+    """Put an API's pending jobs back on the poll schedule (push was switched off)."""
+    now = time.time()
+    pipe = redis_client.pipeline(transaction=False)
+    for otp in OtpPending.objects(api_id=str(api_id)).only("id"):
+        pipe.zadd(POLL_KEY, {str(otp.id): now}, nx=True)
+    pipe.lpush(WAKE_KEY, "")
+    pipe.ltrim(WAKE_KEY, 0, CLAIM_BATCH)
+    pipe.execute()
+
+
+def _claim_due(key: str, now: float) -> list:
+    """Lease up to CLAIM_BATCH due jobs of `key`; returns their ids."""
+    flat = _claim_script(keys=[key, _fence_key(key)], args=[now, now + LEASE_TTL, CLAIM_BATCH])
+    ids = []
+    with _leases_lock:
+        for i in range(0, len(flat), 2):
+            otp_id = flat[i].decode() if isinstance(flat[i], bytes) else flat[i]
+            _leases[(key, otp_id)] = int(flat[i + 1])
+            ids.append(otp_id)
+    return ids
+
+
+def _next_due_in(now: float):
+    """Seconds until the next scheduled event, or None if nothing is scheduled."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zrange(POLL_KEY, 0, 0, withscores=True)
+    pipe.zrange(DEADLINE_KEY, 0, 0, withscores=True)
+    scores = [rows[0][1] for rows in pipe.execute() if rows]
+    if not scores:
+        return None
+    return max(0.0, min(scores) - now)
+
+
+# ===============
+# Job handlers
+# ===============
+def _auto_cancel(otp):
+    """cancelTime reached: cancel at the provider, refund if unused, notify."""
+    try:
+        _provider_for(otp).cancel(otp.order_id)
+    except Exception:
+        pass
+
+    order = _order_of(otp)
+    if not order:
+        otp.delete()
+        return
+
+    # Refund only if NO OTP message exists
+    has_message = OtpMessage.objects(order=order).count() > 0
+    isRefund = not has_message
+
+    # Conditional transition: only one worker (or a user cancel) can finish the order
+    new_status = "refunded" if isRefund else "cancelled"
+    if not Order.objects(id=order.id, status__nin=FINISHED_STATUSES).update_one(set__status=new_status):
+        # The user cancelled or another worker finished it: they already notified
+        otp.delete()
+        return
+
+    order.status = new_status
+    user = otp.user   # loaded with the job: fine for names, stale for the balance
+    if isRefund:
+        # Atomic credit: a purchase may have debited the balance since the tick began
+        user = User.objects(id=order.user.id).modify(inc__balance=order.price, new=True)
+        if user:
+            Transaction(
+                user=user,
+                type="credit",
+                amount=order.price,
+                closing_balance=user.balance,
+                note=f"refund issued for not using mobile number {order.number}"
+            ).save()
+    if not user:
+        # The user was deleted: nobody to credit or notify
+        otp.delete()
+        return
+
+    try:
+        if isRefund:
+            text = f"⏳ <b>Time limit expired for +{otp.phone}.</b>\n<i>You have been refunded {order.price} 💎</i>"
+        else:
+            text = f"⏳ <b>Time limit expired for +{otp.phone}.</b>\n<i>No refund was issued.</i>"
+
+        sender.send_message(otp.chat_id, text)
+
+        notify_admins(
+            auto_cancel_text.format(
+                user_id=user.telegram_id,
+                name=user.name,
+                username=user.username,
+                number=otp.phone,
+                order_id=otp.order_id,
+                price=otp.price,
+                balance=user.balance,
+                auto_cancel_time=otp.cancelTime / 60,
+                refund="Refund issued" if isRefund else "No refund",
+                messages_block=build_messages_block(order)  # ✅ include messages
+            ),
+            event="auto_cancel",
+            detail=f"+{otp.phone} — {otp.price} 💎 — {'refunded' if isRefund else 'no refund'} — user {user.telegram_id}",
+        )
+
+    except Exception:
+        pass
+
+    otp.delete()
+
+
+def _otp_digest(otp_token: str) -> str:
+    return hashlib.sha1(otp_token.encode()).hexdigest()[:16]
+
+
+def _is_new_otp(otp, order, otp_token):
     """
-    Try to acquire the Redis lock.
-    Returns True if successful, False if already locked.
+    Atomically record the code in the job's seen-set.
+    Returns (is_new, is_first_code_of_the_order).
+    Only when the set did not exist yet (first code, or Redis lost its state)
+    is MongoDB asked which codes were stored before; the set is re-seeded with them.
     """
-    return redis_client.set(LOCK_KEY, "locked", ex=LOCK_TTL, nx=True)
+    key = SEEN_KEY.format(otp.id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.exists(key)
+    pipe.sadd(key, _otp_digest(otp_token))
+    pipe.expire(key, (otp.cancelTime or 0) + SEEN_TTL_MARGIN)
+    existed, added, _ = pipe.execute()
+    if not added:
+        return False, False
+    if existed:
+        return True, False
+
+    stored = [m.otp for m in OtpMessage.objects(order=order).only("otp") if m.otp]
+    if stored:
+        redis_client.sadd(key, *[_otp_digest(t) for t in stored])
+    return otp_token not in stored, not stored
+
+
+def _forget_otp(otp, message, otp_token):
+    """Undo a failed delivery: drop the stored message and the seen-set entry."""
+    try:
+        if message is not None:
+            message.delete()
+        redis_client.srem(SEEN_KEY.format(otp.id), _otp_digest(otp_token))
+    except Exception as e:
+        logger.warning("Could not roll back code for job %s: %s", otp.id, e)
+
+
+def _deliver_otp(otp, order, otp_token, raw):
+    """Store a new code, send it to the user, ask for the next SMS, notify admins."""
+    # Avoid duplicate OTPs
+    is_new, is_first = _is_new_otp(otp, order, otp_token)
+    if not is_new:
+        metrics.incr("otp_duplicates")
+        return False
+    if is_first and otp.created_at:
+        telemetry.record(otp.api_id, "first_otp", True, time.time() - _epoch(otp.created_at))
+
+    message = None
+    try:
+        message = OtpMessage(
+            order=order,
+            user=otp.user,
+            otp=otp_token,
+            raw=raw
+        ).save()
+
+        sender.send_message(
+            otp.chat_id,
+            f"💭 <b>New Message:</b> [<i>+{otp.phone}</i>]\n\n<b>Code:</b> <code>{otp_token}</code>"
+        )
+    except Exception:
+        # Not delivered: forget the code so the next poll treats it as new
+        _forget_otp(otp, message, otp_token)
+        raise
 
+    try:
+        if _provider_for(otp).next_sms(otp.order_id):
+            # The next SMS usually follows shortly: back to fast polling
+            otp.last_activity_at = datetime.datetime.utcnow()
+            OtpPending.objects(id=otp.id).update(set__last_activity_at=otp.last_activity_at)
+    except:
+        pass
+
+    _count("otp_delivered", otp.api_id)
+
+    notify_admins(
+        recived_otp_text.format(
+            user_id=otp.user.telegram_id,
+            name=otp.user.name,
+            username=otp.user.username,
+            number=otp.phone,
+            order_id=otp.order_id,
+            price=otp.price,
+            message=otp_token
+        ),
+        event="otp",
+        detail=f"+{otp.phone} — <code>{otp_token}</code> — user {otp.user.telegram_id}",
+    )
+    return True
+
+
+ORDER_FIELDS = ("id", "status", "provider_order_id", "price", "number", "user")
+USER_FIELDS = ("id", "telegram_id", "name", "username", "balance")
+
+
+def _load_jobs(ids) -> list:
+    """
+    Load pending jobs with their order and user attached, using one $in query
+    per collection (projected to the fields the worker reads) instead of
+    lazy per-job lookups. Jobs whose order is gone are dropped and deleted.
+    """
+    jobs = list(OtpPending.objects(id__in=ids).no_dereference())
+
+    # Jobs created before OtpPending.order existed are matched by provider id
+    order_ids = [otp.order.id for otp in jobs if otp.order]
+    legacy_ids = [otp.order_id for otp in jobs if not otp.order]
+    orders = []
+    if order_ids:
+        orders += Order.objects(id__in=order_ids).only(*ORDER_FIELDS).no_dereference()
+    if legacy_ids:
+        orders += Order.objects(provider_order_id__in=legacy_ids).only(*ORDER_FIELDS).no_dereference()
+    by_id = {o.id: o for o in orders}
+    by_provider_id = {o.provider_order_id: o for o in orders}
+
+    user_ids = {otp.user.id for otp in jobs if otp.user}
+    users = {u.id: u for u in User.objects(id__in=list(user_ids)).only(*USER_FIELDS)} if user_ids else {}
+
+    loaded = []
+    for otp in jobs:
+        order = by_id.get(otp.order.id) if otp.order else by_provider_id.get(otp.order_id)
+        if not order:
+            otp.delete()
+            unschedule_otp(otp.id)
+            continue
+        otp.order = order
+        otp.user = users.get(otp.user.id) if otp.user else None
+        loaded.append(otp)
+    return loaded
+
+
+def _order_of(otp):
+    """The job's order: the preloaded one, else a lookup by provider id."""
+    if isinstance(otp.order, Order):
+        return otp.order
+    return Order.objects(provider_order_id=otp.order_id).first()
+
+
+def _active_order(otp):
+    """The order behind a pending job, or None (job deleted) if it is finished."""
+    order = _order_of(otp)
+    if not order or order.status in FINISHED_STATUSES:
+        otp.delete()
+        return None
+    return order
+
+
+def _count(name: str, api_id=None):
+    """Bump a counter globally and per API (`<name>:<api_id>`)."""
+    metrics.incr(name)
+    if api_id:
+        metrics.incr(f"{name}:{api_id}")
+
+
+def _poll_delay(otp, api, now: float) -> float:
+    """
+    Seconds until the next poll of `otp` under its API's policy: fast_poll_interval
+    for fast_poll_window seconds after purchase (or the last next-number request),
+    then multiplied by poll_backoff every further window, capped at
+    max_poll_interval. retry_time is the floor.
+    """
+    if api is None:
+        return POLL_INTERVAL
 
-def refresh_lock():
-    """Extend lock TTL while worker is alive."""
-    redis_client.expire(LOCK_KEY, LOCK_TTL)
+    fast = api.fast_poll_interval or POLL_INTERVAL
+    window = api.fast_poll_window or 0
+    since = otp.last_activity_at or otp.created_at
+    elapsed = now - _epoch(since) if since else 0
 
+    delay = fast
+    if window and elapsed >= window:
+        steps = int((elapsed - window) // window) + 1
+        delay = fast * (api.poll_backoff or 1) ** steps
+        if api.max_poll_interval:
+            delay = min(delay, max(api.max_poll_interval, fast))
+    return max(delay, api.retry_time or 0)
 
-def release_lock():
-    """Release the lock when worker stops."""
-    redis_client.delete(LOCK_KEY)
+
+def _reschedule(otp, api=None):
+    now = time.time()
+    _release(POLL_KEY, otp.id, now + _poll_delay(otp, api, now))
+
+
+def _poll(otp) -> bool:
+    """Poll the provider once. Returns False if the job is finished."""
+    order = _active_order(otp)
+    if not order:
+        return False
+
+    try:
+        _count("otp_poll_requests", otp.api_id)
+        otp_token, raw = _provider_for(otp).get_status(otp.order_id)
+        if otp_token and _owns(POLL_KEY, otp.id):
+            _deliver_otp(otp, order, otp_token, raw)
+    except Exception as e:
+        logger.warning("Status poll failed for order %s: %s", otp.order_id, e)
+    return True
+
+
+def _load_apis(api_ids) -> dict:
+    """
+    {api_id: ConnectApi} from the provider cache; only cache misses hit MongoDB.
+    A misconfigured API is left out: its breaker is open, so its jobs back off.
+    """
+    apis = {}
+    for api_id in set(api_ids):
+        try:
+            provider = get_provider(api_id) if api_id else None
+        except ValueError:
+            continue
+        if provider is not None:
+            apis[api_id] = provider.api
+    return apis
 
 
 # ===============
 # Worker Function
 # ===============
-def otp_worker():
-    global worker_thread
+def _tick(now: float):
+    """Run every due deadline and poll once."""
+    try:
+        _run_due(now)
+    finally:
+        # Anything not handed back or in flight (crash mid-tick) comes due again
+        # after LEASE_TTL
+        with _leases_lock:
+            for key, otp_id in list(_leases):
+                if key != POLL_KEY or otp_id not in _in_flight:
+                    del _leases[(key, otp_id)]
+
+
+def _run_due(now: float):
+    expired = [otp_id for otp_id in _claim_due(DEADLINE_KEY, now) if _owns(DEADLINE_KEY, otp_id)]
+    if expired:
+        done = set(expired)
+        for otp in _load_jobs(expired):
+            try:
+                _auto_cancel(otp)
+            except Exception as e:
+                # Keep the deadline: one bad job must not stop the worker
+                logger.exception("Auto-cancel of job %s failed: %s", otp.id, e)
+                done.discard(str(otp.id))
+                _release(DEADLINE_KEY, otp.id, time.time() + DEADLINE_RETRY)
+        for otp_id in done:
+            unschedule_otp(otp_id)
+
+    due = _claim_due(POLL_KEY, now)
+    if not due:
+        return
+
+    with metrics.timer("otp_poll_stage_seconds"):
+        jobs = _load_jobs(due)
+        for missing in set(due) - {str(otp.id) for otp in jobs}:
+            unschedule_otp(missing)
+
+        # One request per bulk-capable API, one per order for the rest
+        apis = _load_apis(otp.api_id for otp in jobs)
+        groups, singles = {}, []
+        for otp in jobs:
+            api = apis.get(otp.api_id)
+            if api and api.push_enabled:
+                _stop_polling(otp.id)   # provider pushes codes to /webhooks/otp
+            elif api and api.bulk_status_url:
+                groups.setdefault(otp.api_id, []).append(otp)
+            else:
+                singles.append(otp)
+
+        for api_id, otps in groups.items():
+            _dispatch(apis[api_id].bulk_status_url, otps, _poll_group, apis[api_id], otps)
+        for otp in singles:
+            api = apis.get(otp.api_id)
+            url = (api.get_status_url if api else None) or otp.url
+            _dispatch(url, [otp], _poll_job, otp, api)
+
+
+def _parse_push(data: dict):
+    """
+    Pull (order_id, otp_token, raw) out of a provider callback body.
+    Accepts the common key spellings; a bare SMS text is delivered as-is.
+    """
+    order_id = next((data[k] for k in PUSH_ORDER_KEYS if data.get(k)), None)
+    otp_token = next((data[k] for k in PUSH_CODE_KEYS if data.get(k)), None)
+    if isinstance(otp_token, list):
+        otp_token = otp_token[-1] if otp_token else None
+    return (str(order_id) if order_id else None), (str(otp_token) if otp_token else None), data
+
+
+def receive_pushed_otp(api, data: dict) -> bool:
+    """Deliver a code POSTed by a push-enabled provider. Returns True if it was new."""
+    order_id, otp_token, raw = _parse_push(data)
+    if not order_id or not otp_token:
+        return False
+
+    otp = OtpPending.objects(api_id=str(api.id), order_id=order_id).first()
+    if not otp:
+        return False
+    order = _active_order(otp)
+    if not order:
+        unschedule_otp(otp.id)
+        return False
+
+    _count("otp_push_received", otp.api_id)
+    return _deliver_otp(otp, order, otp_token, raw)
 
-    if not acquire_lock():
-        print("⚠️ Another process is already running the worker.")
+
+def _poll_job(otp, api=None):
+    try:
+        if not breaker.allow(otp.api_id):
+            # Provider is failing: keep the job but stop hammering it
+            _release(POLL_KEY, otp.id, time.time() + BREAKER_BACKOFF)
+            return
+        if _poll(otp):
+            _reschedule(otp, api)
+        else:
+            unschedule_otp(otp.id)
+    except Exception as e:
+        logger.exception("Poll job %s failed: %s", otp.id, e)
+        _release(POLL_KEY, otp.id, time.time() + POLL_INTERVAL)
+
+
+def _poll_group(api, otps):
+    """One bulk status request for every due order of `api`, then fan out."""
+    if not breaker.allow(str(api.id)):
+        for otp in otps:
+            _release(POLL_KEY, otp.id, time.time() + BREAKER_BACKOFF)
         return
 
     try:
-        if bot_instance:
-            bot_instance.send_message(DEBUG_ADMIN_ID, "✅ OTP Worker started.")
-
-        while True:
-            pending_otps = OtpPending.objects()
-            if not pending_otps:
-                break  # Stop if no jobs
-
-            for otp in pending_otps:
-
-                order = Order.objects(provider_order_id=otp.order_id).first()
-                if not order or order.status in ("cancelled", "refunded", "completed"):
-                    otp.delete()
-                    continue
-
-                elapsed_time = (datetime.datetime.utcnow() - otp.created_at).total_seconds()
-
-                # =====================
-                # Timeout / Auto-cancel
-                # =====================
-                if otp.cancelTime and elapsed_time > otp.cancelTime:
-                    try:
-                        if otp.cancel_url:
-                            requests.get(otp.cancel_url.format(id=otp.order_id), timeout=5)
-                    except Exception:
-                        pass
-
-                    order = Order.objects(provider_order_id=otp.order_id).first()
-                    if not order:
-                        otp.delete()
-                        continue
-
-                    # Refund only if NO OTP message exists
-                    has_message = OtpMessage.objects(order=order).count() > 0
-                    isRefund = not has_message
-
-                    if order.status not in ("cancelled", "refunded", "completed"):
-                        user = order.user
-                        if isRefund:
-                            user.balance += order.price
-                            user.save()
-                            Transaction(
-                                user=user,
-                                type="credit",
-                                amount=order.price,
-                                closing_balance=user.balance,
-                                note=f"refund issued for not using mobile number {order.number}"
-                            ).save()
-                            order.status = "refunded"
-                        else:
-                            order.status = "cancelled"
-                        order.save()
-
-                    try:
-                        if isRefund:
-                            text = f"⏳ <b>Time limit expired for +{otp.phone}.</b>\n<i>You have been refunded {order.price} 💎</i>"
-                        else:
-                            text = f"⏳ <b>Time limit expired for +{otp.phone}.</b>\n<i>No refund was issued.</i>"
-
-                        bot_instance.send_message(chat_id=otp.chat_id, text=text)
-
-                        admins = Admin.objects()
-                        for admin in admins:
-                            bot_instance.send_message(
-                                admin.telegram_id,
-                                auto_cancel_text.format(
-                                    user_id=otp.user.telegram_id,
-                                    name=otp.user.name,
-                                    username=otp.user.username,
-                                    number=otp.phone,
-                                    order_id=otp.order_id,
-                                    price=otp.price,
-                                    balance=otp.user.balance,
-                                    auto_cancel_time=otp.cancelTime / 60,
-                                    refund="Refund issued" if isRefund else "No refund",
-                                    messages_block=build_messages_block(order)  # ✅ include messages
-                                )
-                            )
-
-                    except Exception:
-                        pass
-
-                    otp.delete()
-                    continue
-
-                # =====================
-                # Fetch OTP
-                # =====================
-                try:
-                    url = otp.url.format(id=otp.order_id)
-                    resp = requests.get(url, timeout=5)
-
-                    otp_token = None
-                    is_new = False
-                    order = Order.objects(provider_order_id=otp.order_id).first()
-                    if not order:
-                        otp.delete()
-                        continue
-
-                    if otp.responseType == "Text":
-                        raw = resp.text.strip()
-                        if raw.startswith("STATUS_OK") or raw.startswith("ACCESS_OTP") or "OTP" in raw:
-                            parts = raw.split(":")
-                            otp_token = parts[1] if len(parts) > 1 else raw
-
-                            # Avoid duplicate OTPs
-                            is_new = not OtpMessage.objects(order=order, otp=otp_token).first()
-
-                            if is_new:
-                                OtpMessage(
-                                    order=order,
-                                    user=otp.user,
-                                    otp=otp_token,
-                                    raw={"text": raw}
-                                ).save()
-
-                                bot_instance.send_message(
-                                    otp.chat_id,
-                                    f"💭 <b>New Message:</b> [<i>+{otp.phone}</i>]\n\n<b>Code:</b> <code>{otp_token}</code>"
-                                )
-
-                                try:
-                                    if otp.next_otp_url:
-                                        requests.get(otp.next_otp_url.format(id=otp.order_id), timeout=5)
-                                except:
-                                    pass
-
-                                admins = Admin.objects()
-                                for admin in admins:
-                                    bot_instance.send_message(
-                                        admin.telegram_id,
-                                        recived_otp_text.format(
-                                            user_id=otp.user.telegram_id,
-                                            name=otp.user.name,
-                                            username=otp.user.username,
-                                            number=otp.phone,
-                                            order_id=otp.order_id,
-                                            price=otp.price,
-                                            message=otp_token
-                                        )
-                                    )
-
-                    else:
-                        res = resp.json()
-                        status = res.get("status") or res.get("state")
-                        otp_token = res.get("otp") or res.get("sms")
-
-                        if status in ("ok", "STATUS_OK", "SUCCESS") or otp_token:
-                            otp_token = otp_token if isinstance(otp_token, str) else str(otp_token)
-
-                            # Avoid duplicates
-                            is_new = not OtpMessage.objects(order=order, otp=otp_token).first()
-
-                            if is_new:
-                                OtpMessage(
-                                    order=order,
-                                    user=otp.user,
-                                    otp=otp_token,
-                                    raw=res
-                                ).save()
-
-                                bot_instance.send_message(
-                                    otp.chat_id,
-                                    f"💭 <b>New Message:</b> [<i>+{otp.phone}</i>]\n\n<b>Code:</b> <code>{otp_token}</code>"
-                                )
-
-                                try:
-                                    if otp.next_otp_url:
-                                        requests.get(otp.next_otp_url.format(id=otp.order_id), timeout=5)
-                                except:
-                                    pass
-
-                                admins = Admin.objects()
-                                for admin in admins:
-                                    bot_instance.send_message(
-                                        admin.telegram_id,
-                                        recived_otp_text.format(
-                                            user_id=otp.user.telegram_id,
-                                            name=otp.user.name,
-                                            username=otp.user.username,
-                                            number=otp.phone,
-                                            order_id=otp.order_id,
-                                            price=otp.price,
-                                            message=otp_token
-                                        )
-                                    )
-
-                except Exception as e:
-                    print("Fetch OTP Error:", e)
-                    pass
-
-            # Keep refreshing lock
-            refresh_lock()
-            time.sleep(1)
+        _count("otp_poll_requests", str(api.id))
+        results = get_provider(api).bulk_status()
+    except Exception as e:
+        logger.warning("Bulk status failed for %s: %s", api.api_name, e)
+        results = {}
+
+    for otp in otps:
+        try:
+            order = _active_order(otp)
+            if not order:
+                unschedule_otp(otp.id)
+                continue
+            otp_token, raw = results.get(otp.order_id, (None, None))
+            if otp_token and _owns(POLL_KEY, otp.id):
+                _deliver_otp(otp, order, otp_token, raw)
+            _reschedule(otp, api)
+        except Exception as e:
+            logger.exception("Poll job %s failed: %s", otp.id, e)
+            _release(POLL_KEY, otp.id, time.time() + POLL_INTERVAL)
+
+
+def _wait_for_work(timeout: float):
+    """Block until a new job is announced or `timeout` seconds pass."""
+    # Redis before 7 reads a BRPOP timeout as whole seconds: below 10ms it
+    # could round to 0, which means "block forever"
+    if timeout < 0.01:
+        return
+    try:
+        if redis_client.brpop(WAKE_KEY, timeout=timeout):
+            # One tick serves every pending wake-up
+            redis_client.delete(WAKE_KEY)
+    except Exception as e:
+        logger.warning("Wake wait failed: %s", e)
+        time.sleep(min(timeout, MAX_IDLE_SLEEP))
+
+
+def otp_worker(stop: threading.Event):
+    """Run ticks until `stop` is set; the current tick always completes."""
+    # No global lock: every process may run a worker, jobs are leased one by one
+    stop_heartbeat = threading.Event()
+    _status["started_at"] = time.time()
+    try:
+        _heartbeat()
+        threading.Thread(target=_heartbeat_loop, args=(stop_heartbeat,), daemon=True).start()
+
+        rebuild_schedule()
+        while not stop.is_set():
+            try:
+                _tick(time.time())
+                _status["last_tick"] = time.time()
+                _status["ticks"] += 1
+
+                # Block until the next job is due or a new one is announced
+                wait = _next_due_in(time.time())
+            except Exception as e:
+                # Transient Redis / MongoDB trouble: unreleased jobs come due again
+                logger.exception("OTP worker tick failed: %s", e)
+                _status["errors"] += 1
+                stop.wait(ERROR_BACKOFF)
+                continue
+            _wait_for_work(IDLE_WAIT if wait is None else min(wait, MAX_IDLE_SLEEP))
 
     finally:
-        release_lock()
-        if bot_instance:
-            bot_instance.send_message(DEBUG_ADMIN_ID, "🛑 OTP Worker stopped (no more jobs).")
-        with otp_lock:
-            worker_thread = None
+        stop_heartbeat.set()
+        redis_client.zrem(WORKERS_KEY, WORKER_ID)
+        redis_client.hdel(HEALTH_KEY, WORKER_ID)
 
 
 # ===============
-# Thread Spawner
+# Job intake
 # ===============
-def notify_new_otp():
-    global worker_thread
-    with otp_lock:
-        if worker_thread and worker_thread.is_alive():
-            return  # Already running in this process
-        worker_thread = threading.Thread(target=otp_worker, daemon=True)
-        worker_thread.start()
-
-
-def init_worker(bot):
-    global bot_instance
-    bot_instance = bot
+def notify_new_otp(otp=None, poll: bool = True):
+    """Schedule a new pending OTP and wake an idle worker."""
+    if otp is not None:
+        schedule_otp(otp, poll=poll)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.lpush(WAKE_KEY, str(otp.id) if otp is not None else "")
+    pipe.ltrim(WAKE_KEY, 0, CLAIM_BATCH)
+    pipe.execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the OTP polling worker")
+    parser.add_argument("--health", action="store_true",
+                        help="print worker health as JSON and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from bot.runtime import create_bot
+    from bot.sender import start_sender
+    from utils.registry import load_registries
+
+    bot = create_bot()
+    if args.health:
+        report = health()
+        print(json.dumps(report, indent=2))
+        raise SystemExit(0 if report["workers"] else 1)
+
+    load_registries()
+    start_sender(bot)   # leader-elected: drains the outbox only if no one else does
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    logger.info("OTP worker %s started", WORKER_ID)
+    try:
+        otp_worker(stop)
+    finally:
+        _shutdown_poll_pools()
+        logger.info("OTP worker %s stopped", WORKER_ID)
+
+
+if __name__ == "__main__":
+    main()